@@ -0,0 +1,117 @@
+#synthetic audio corpus for the benchmarks
+#files have real container headers (so mutagen and the lossless mp3 path can read them) and
+#seeded random payloads, the same seed and settings always give byte-identical files
+import argparse
+import os
+import random
+import struct
+
+#(extension, share of the corpus)
+FORMATS = [(".flac", 0.5), (".mp3", 0.3), (".m4a", 0.2)]
+#track lengths in seconds, picked at random per file
+DURATIONS = (30, 120, 240, 420)
+#average bytes per second of each format, sets the file size for a duration
+BYTE_RATES = {".flac": 110000, ".mp3": 16000, ".m4a": 32000}
+#files per album folder, albums are grouped into artist folders
+ALBUM_SIZE = 12
+ALBUMS_PER_ARTIST = 4
+
+def _flac(rng, seconds, rate=44100, channels=2, bits=16):
+    #fLaC marker, STREAMINFO, 8 KiB of padding like most encoders leave, then the "frames"
+    samples = rate * seconds
+    info = struct.pack(">HH", 4096, 4096) + b"\0" * 6
+    packed = (rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | samples
+    info += packed.to_bytes(8, "big") + bytes(16)
+    header = b"fLaC" + bytes([0]) + len(info).to_bytes(3, "big") + info
+    header += bytes([0x80 | 1]) + (8192).to_bytes(3, "big") + bytes(8192)
+    return header + rng.randbytes(seconds * BYTE_RATES[".flac"])
+
+def _set_bits(frame, bit_pos, count, value):
+    for i in range(count):
+        bit = bit_pos + i
+        mask = 1 << (7 - bit % 8)
+        if (value >> (count - 1 - i)) & 1:
+            frame[bit // 8] |= mask
+        else:
+            frame[bit // 8] &= ~mask & 0xFF
+
+def _mp3(rng, seconds):
+    #mpeg 1 layer iii frames, 128 kbps 44.1 khz joint stereo without crc, global_gain set to a
+    #plausible value in every granule so the lossless gain path has something to adjust
+    frames = seconds * 44100 // 1152
+    out = bytearray()
+    for _ in range(frames):
+        frame = bytearray(b"\xff\xfb\x90\x40" + bytes(32)) + rng.randbytes(417 - 36)
+        for granule in range(4):
+            _set_bits(frame, 32 + 20 + granule * 59 + 21, 8, 170)
+        out += frame
+    return bytes(out)
+
+def _atom(name, payload):
+    return struct.pack(">I", 8 + len(payload)) + name + payload
+
+def _m4a(rng, seconds, rate=44100):
+    #ftyp + moov with one sound track (mdhd/hdlr/stsd mp4a) + mdat, enough for mutagen's MP4Info
+    mvhd = _atom(b"mvhd", struct.pack(">B3xIIII", 0, 0, 0, 1000, seconds * 1000) + bytes(80))
+    mdhd = _atom(b"mdhd", struct.pack(">B3xIIIIHH", 0, 0, 0, rate, seconds * rate, 0, 0))
+    hdlr = _atom(b"hdlr", struct.pack(">B3xI4s", 0, 0, b"soun") + bytes(12) + b"\0")
+    #esds: es descriptor > decoder config (aac, 256 kbps) > audio specific config (aac lc, 44.1 khz, stereo)
+    specific = bytes([0x05, 2, 0x12, 0x10])
+    config = bytes([0x04, 13 + len(specific), 0x40, 0x15]) + bytes(3) + struct.pack(">II", 256000, 256000) + specific
+    descriptor = bytes([0x03, 3 + len(config) + 3]) + bytes(3) + config + bytes([0x06, 1, 0x02])
+    esds = _atom(b"esds", bytes(4) + descriptor)
+    entry = _atom(b"mp4a", bytes(6) + struct.pack(">H", 1) + bytes(8) + struct.pack(">HHHHI", 2, 16, 0, 0, rate << 16) + esds)
+    stsd = _atom(b"stsd", struct.pack(">B3xI", 0, 1) + entry)
+    trak = _atom(b"trak", _atom(b"mdia", mdhd + hdlr + _atom(b"minf", _atom(b"stbl", stsd))))
+    ftyp = _atom(b"ftyp", b"M4A " + struct.pack(">I", 0) + b"M4A mp42isom")
+    return ftyp + _atom(b"moov", mvhd + trak) + _atom(b"mdat", rng.randbytes(seconds * BYTE_RATES[".m4a"]))
+
+WRITERS = {".flac": _flac, ".mp3": _mp3, ".m4a": _m4a}
+
+def corpus_plan(count, seed=0):
+    #return [(relative path, extension, seconds)] for a corpus of count files
+    rng = random.Random(seed)
+    plan = []
+    for i in range(count):
+        ext = rng.choices([f[0] for f in FORMATS], [f[1] for f in FORMATS])[0]
+        album = i // ALBUM_SIZE
+        folder = os.path.join(f"artist{album // ALBUMS_PER_ARTIST:04d}", f"album{album:05d}")
+        plan.append((os.path.join(folder, f"{i % ALBUM_SIZE + 1:02d} track{i:06d}{ext}"), ext, rng.choice(DURATIONS)))
+    return plan
+
+def make_corpus(dest, count, seed=0):
+    """
+    Write count files under dest in artist/album folders, mixing formats and track lengths.
+    Existing files of the right size are left alone so a corpus can be reused between runs.
+    Returns the list of file paths in a stable order.
+    """
+    paths = []
+    for i, (rel, ext, seconds) in enumerate(corpus_plan(count, seed)):
+        path = os.path.join(dest, rel)
+        #each file gets its own generator so files don't depend on the ones generated before them
+        rng = random.Random(f"{seed}:{i}")
+        data = WRITERS[ext](rng, seconds)
+        try:
+            if os.path.getsize(path) == len(data):
+                paths.append(path)
+                continue
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic audio corpus for the benchmarks.")
+    parser.add_argument("dest", help="folder to write the corpus to")
+    parser.add_argument("-n", "--files", type=int, default=200, help="number of files (default: 200)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args()
+    paths = make_corpus(args.dest, args.files, args.seed)
+    total = sum(os.path.getsize(p) for p in paths)
+    print(f"{len(paths)} files, {total / 1e6:.1f} MB in {args.dest}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#throughput benchmarks for museamp's workers against a synthetic corpus
+#every case runs in its own process so peak rss is per case, results are written as json
+#that can be compared between commits with --compare
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+STUBS = os.path.join(HERE, "stubs")
+sys.path.insert(0, ROOT)
+
+#name -> does the case change files (those run on a fresh copy of the corpus each time)
+CASES = {
+    "walk": False,          #find_supported_files over the corpus folder
+    "scan": False,          #AddFilesWorker, rsgain custom per file/batch
+    "scan-easy": False,     #AddFilesWorker with rsgain's easy mode
+    "tag": True,            #Worker, analyze & tag
+    "apply-gain": True,     #ApplyGainWorker, measure then change the audio
+}
+
+def _peak_rss_mb():
+    #peak resident set size of this process in MB
+    #linux keeps ru_maxrss across fork/exec so it would include the parent's peak, VmHWM doesn't
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    #ru_maxrss is in bytes on macos
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+def _workers():
+    #the qt workers when PySide6 is installed, run() is called directly so no event loop is needed
+    try:
+        from museamp import workers
+        return workers
+    except ImportError:
+        return None
+
+def run_case(case, folder, jobs, batch_size):
+    #run one case in this process, returns its measurements
+    from museamp.jobs import supported_filetypes, scan_files, tag_files, apply_gain
+    from museamp.utils import find_supported_files
+    files = sorted(find_supported_files(folder, supported_filetypes))
+    size = sum(os.path.getsize(f) for f in files)
+    workers = _workers()
+    results = []
+    error_logs = []
+    start = time.perf_counter()
+    if case == "walk":
+        results = find_supported_files(folder, supported_filetypes)
+    elif workers is not None:
+        if case in ("scan", "scan-easy"):
+            worker = workers.AddFilesWorker(files, jobs=jobs, batch_size=batch_size, folders=[folder],
+                                            backend="easy" if case == "scan-easy" else "custom")
+        elif case == "tag":
+            worker = workers.Worker(files, 18, 0.0, jobs=jobs, batch_size=batch_size)
+        else:
+            worker = workers.ApplyGainWorker(files, 18, 0.0, None, supported_filetypes, jobs=jobs, batch_size=batch_size)
+        worker.results.connect(results.extend)
+        worker.finished.connect(error_logs.extend)
+        worker.run()
+    elif case in ("scan", "scan-easy"):
+        error_logs = scan_files(files, jobs=jobs, batch_size=batch_size, folders=[folder],
+                                backend="easy" if case == "scan-easy" else "custom", on_results=results.extend)
+    elif case == "tag":
+        error_logs = tag_files(files, 18, 0.0, jobs=jobs, batch_size=batch_size, on_results=results.extend)
+    else:
+        error_logs = apply_gain(files, 18, 0.0, supported_filetypes, jobs=jobs, batch_size=batch_size,
+                                on_results=results.extend)
+    elapsed = time.perf_counter() - start
+    return {
+        "layer": "jobs" if workers is None or case == "walk" else "workers",
+        "files": len(files),
+        "bytes": size,
+        "results": len(results),
+        "errors": len(error_logs),
+        "seconds": elapsed,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def _git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return rev, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def _child_env(args):
+    env = dict(os.environ)
+    if not args.real_tools:
+        env["PATH"] = STUBS + os.pathsep + env.get("PATH", "")
+    env["MUSEAMP_BENCH_LATENCY"] = str(args.latency)
+    env["MUSEAMP_BENCH_DECODE_MBPS"] = str(args.decode_mbps)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+def _run_child(case, folder, args):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", case, "--folder", folder, "--batch-size", str(args.batch_size)]
+    if args.jobs:
+        cmd += ["--jobs", str(args.jobs)]
+    proc = subprocess.run(cmd, env=_child_env(args), capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{case} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.splitlines()[-1])
+
+def summarize(runs):
+    #median time over the repeats, throughput from the median, the highest rss seen
+    seconds = statistics.median(r["seconds"] for r in runs)
+    first = runs[0]
+    peaks = [r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None]
+    return {
+        "layer": first["layer"],
+        "files": first["files"],
+        "megabytes": round(first["bytes"] / 1e6, 3),
+        "results": first["results"],
+        "errors": first["errors"],
+        "seconds": round(seconds, 4),
+        "seconds_all": [round(r["seconds"], 4) for r in runs],
+        "files_per_s": round(first["files"] / seconds, 2) if seconds else None,
+        "mb_per_s": round(first["bytes"] / 1e6 / seconds, 2) if seconds else None,
+        "peak_rss_mb": round(max(peaks), 1) if peaks else None,
+    }
+
+def run_benchmarks(args):
+    from corpus import make_corpus
+    corpus = args.corpus or os.path.join(tempfile.gettempdir(), f"museamp-bench-{args.files}-{args.seed}")
+    make_corpus(corpus, args.files, args.seed)
+    revision, dirty = _git_revision()
+    report = {
+        "revision": revision,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "files": args.files, "seed": args.seed, "jobs": args.jobs, "batch_size": args.batch_size,
+            "repeat": args.repeat, "latency": args.latency, "decode_mbps": args.decode_mbps,
+            "tools": "real" if args.real_tools else "stub",
+        },
+        "cases": {},
+    }
+    for case in args.cases:
+        runs = []
+        for _ in range(args.repeat):
+            if CASES[case]:
+                with tempfile.TemporaryDirectory(prefix="museamp-bench-") as scratch:
+                    folder = os.path.join(scratch, "corpus")
+                    shutil.copytree(corpus, folder)
+                    runs.append(_run_child(case, folder, args))
+            else:
+                runs.append(_run_child(case, corpus, args))
+        report["cases"][case] = summarize(runs)
+        summary = report["cases"][case]
+        print(f"{case:<11} {summary['files_per_s']:>9} files/s {summary['mb_per_s']:>9} MB/s "
+              f"rss {summary['peak_rss_mb']} MB ({summary['errors']} errors)", file=sys.stderr)
+    return report
+
+def compare(old_path, new_path):
+    #print the throughput change per case between two result files
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    if old.get("settings") != new.get("settings"):
+        print("warning: the runs used different settings, the numbers aren't directly comparable")
+    print(f"{'case':<11} {'old files/s':>12} {'new files/s':>12} {'change':>8} {'old rss':>8} {'new rss':>8}")
+    for case, result in new["cases"].items():
+        before = old["cases"].get(case)
+        if before is None or not before["files_per_s"]:
+            continue
+        change = (result["files_per_s"] / before["files_per_s"] - 1) * 100
+        print(f"{case:<11} {before['files_per_s']:>12} {result['files_per_s']:>12} {change:>+7.1f}% "
+              f"{before['peak_rss_mb']!s:>8} {result['peak_rss_mb']!s:>8}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark museamp's workers on a synthetic corpus with stand-in tools.")
+    parser.add_argument("-n", "--files", type=int, default=200, help="files in the corpus (default: 200)")
+    parser.add_argument("--seed", type=int, default=0, help="corpus random seed (default: 0)")
+    parser.add_argument("--corpus", default=None, help="corpus folder, reused if it exists (default: in the temp folder)")
+    parser.add_argument("--cases", default=",".join(CASES), type=lambda s: s.split(","),
+                        help=f"comma separated cases (default: {','.join(CASES)})")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker jobs (default: museamp's default)")
+    parser.add_argument("--batch-size", type=int, default=1, help="files per rsgain call (default: 1)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per case, the median is reported (default: 3)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds each stub process takes to start (default: 0)")
+    parser.add_argument("--decode-mbps", type=float, default=0.0,
+                        help="simulated stub decode speed in MB/s per file, 0 for instant (default: 0)")
+    parser.add_argument("--real-tools", action="store_true", help="use the installed rsgain/ffmpeg instead of the stubs")
+    parser.add_argument("-o", "--output", default=None, help="write the json report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two json reports and exit")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    if args.child:
+        print(json.dumps(run_case(args.child, args.folder, args.jobs, args.batch_size)))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+    unknown = [case for case in args.cases if case not in CASES]
+    if unknown:
+        sys.exit(f"unknown case: {', '.join(unknown)}")
+    report = run_benchmarks(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
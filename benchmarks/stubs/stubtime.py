@@ -0,0 +1,26 @@
+#shared timing for the stand-in tools, set by benchmarks/run.py through the environment
+#MUSEAMP_BENCH_LATENCY: seconds every process takes before doing anything (startup, probing)
+#MUSEAMP_BENCH_DECODE_MBPS: simulated decode speed per file in MB/s, 0 means instant
+import os
+import time
+
+LATENCY = float(os.environ.get("MUSEAMP_BENCH_LATENCY", "0") or 0)
+DECODE_MBPS = float(os.environ.get("MUSEAMP_BENCH_DECODE_MBPS", "0") or 0)
+
+def start():
+    if LATENCY > 0:
+        time.sleep(LATENCY)
+
+def read_file(path):
+    #read the whole file like a decoder would, sleeping for the simulated codec time
+    #returns the byte count, raises OSError if it can't be read
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            size += len(chunk)
+    if DECODE_MBPS > 0:
+        time.sleep(size / (DECODE_MBPS * 1e6))
+    return size
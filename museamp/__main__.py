@@ -1,5 +1,6 @@
 #entry point for running MuseAmp as a module: python -m museamp
-from .main import main
+#without arguments this opens the gui, with a command (scan/tag/apply-gain) it runs headless
+from .cli import main
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,155 @@
+#persistent on-disk cache of rsgain analysis results
+import os
+import sqlite3
+import threading
+import time
+from .utils import get_cache_dir
+
+#modes whose stored peak is a true peak (rsgain -t or the native true peak meter), with the
+#loudness these are enough to work out the gain for any target and limiter
+TRUE_PEAK_MODES = ("tag", "measure")
+
+#bump when the stored columns change so old caches get dropped instead of misread
+CACHE_VERSION = 1
+
+class AnalysisCache:
+    """
+    SQLite cache of per-file analysis results.
+    Entries are keyed on the file path plus the analysis parameters (mode, target lufs, limiter),
+    and are only returned while the file's size, mtime and inode still match what was stored.
+    """
+
+    def __init__(self, path=None, max_entries=200000):
+        if path is None:
+            path = os.path.join(get_cache_dir(), "analysis.sqlite3")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pending = 0   #writes since the last commit
+        #workers call in from pool threads, access is serialized with _lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != CACHE_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS results")
+            self._conn.execute(f"PRAGMA user_version={CACHE_VERSION}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " path TEXT NOT NULL, mode TEXT NOT NULL, lufs TEXT NOT NULL, limiter TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL,"
+            " loudness TEXT, gain TEXT, clipping TEXT, peak REAL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (path, mode, lufs, limiter))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(file_path, mode, lufs, limiter):
+        #normalize the parameters so -18 and -18.0 hit the same entry
+        lufs = "default" if lufs is None else f"{abs(float(lufs)):.2f}"
+        limiter = "default" if limiter is None else f"{abs(float(limiter)):.2f}"
+        return os.path.abspath(file_path), mode, lufs, limiter
+
+    def get(self, file_path, mode, lufs=None, limiter=None):
+        #return (loudness_val, replaygain_val, clipping_val, peak) if the file is unchanged, else None
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        key = self._key(file_path, mode, lufs, limiter)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode, loudness, gain, clipping, peak FROM results"
+                " WHERE path=? AND mode=? AND lufs=? AND limiter=?", key
+            ).fetchone()
+            if row is None:
+                return None
+            if (row[0], row[1], row[2]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                #file changed since it was analyzed, the entry is stale
+                self._conn.execute(
+                    "DELETE FROM results WHERE path=? AND mode=? AND lufs=? AND limiter=?", key
+                )
+                self._note_write()
+                return None
+            self._conn.execute(
+                "UPDATE results SET last_used=? WHERE path=? AND mode=? AND lufs=? AND limiter=?",
+                (time.time(),) + key
+            )
+            self._note_write()
+        return row[3], row[4], row[5], row[6]
+
+    def get_measurement(self, file_path):
+        #return (loudness_lufs, true_peak) from any valid entry that has them, else None
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        placeholders = ", ".join("?" for _ in TRUE_PEAK_MODES)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT size, mtime_ns, inode, loudness, peak FROM results"
+                f" WHERE path=? AND mode IN ({placeholders}) AND peak IS NOT NULL ORDER BY last_used DESC",
+                (os.path.abspath(file_path),) + TRUE_PEAK_MODES
+            ).fetchall()
+        for size, mtime_ns, inode, loudness_val, peak in rows:
+            if (size, mtime_ns, inode) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                continue
+            try:
+                return float(str(loudness_val).split()[0]), peak
+            except (ValueError, IndexError):
+                continue
+        return None
+
+    def put(self, file_path, mode, lufs, limiter, result):
+        #store a (loudness_val, replaygain_val, clipping_val, peak) result for the file as it is on disk now
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return
+        loudness_val, replaygain_val, clipping_val, peak = result
+        key = self._key(file_path, mode, lufs, limiter)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (st.st_size, st.st_mtime_ns, st.st_ino,
+                       loudness_val, replaygain_val, clipping_val, peak, time.time())
+            )
+            self._note_write()
+
+    def _note_write(self):
+        #commit in batches, evicting the least recently used entries once over the size limit
+        self._pending += 1
+        if self._pending >= 200:
+            self._commit()
+
+    def _commit(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN"
+                " (SELECT rowid FROM results ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self._conn.commit()
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def invalidate(self, file_path=None):
+        #forget one file's results, or everything when no path is given
+        with self._lock:
+            if file_path is None:
+                self._conn.execute("DELETE FROM results")
+            else:
+                self._conn.execute("DELETE FROM results WHERE path=?", (os.path.abspath(file_path),))
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
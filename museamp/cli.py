@@ -0,0 +1,207 @@
+#command line interface, runs the same jobs as the gui without importing qt
+import argparse
+import json
+import os
+import sys
+import threading
+from .jobs import supported_filetypes, scan_files, tag_files, apply_gain
+from . import trace
+from .rsgain import DEFAULT_BATCH_SIZE
+from .utils import iter_supported_files
+
+FIELDS = ["file", "loudness_lufs", "gain_db", "clipping"]
+
+def _number(value):
+    #table values look like "-9.50 LUFS" or "-8.50", "-" when unknown
+    try:
+        return float(str(value).split()[0])
+    except (ValueError, IndexError):
+        return None
+
+def _record(path, loudness_val, replaygain_val, clipping_val, peak=None):
+    #peak is only sent along so the gui can re-target rows, it isn't part of the output
+    clipping = {"Yes": True, "No": False}.get(clipping_val)
+    return {"file": path, "loudness_lufs": _number(loudness_val), "gain_db": _number(replaygain_val), "clipping": clipping}
+
+def expand_paths(paths, recursive=True, jobs=None):
+    #files are kept as given, folders are replaced by the supported files in them (sorted)
+    files = []
+    errors = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = [f for batch in iter_supported_files(path, supported_filetypes, recursive, jobs=jobs, errors=errors) for f in batch]
+            files.extend(sorted(found))
+        else:
+            files.append(path)
+    return files, errors
+
+class Output:
+    #writes results to stdout as they arrive and progress/errors to stderr
+    #with progress on, stderr is json lines ({"progress": n} / {"error": msg}) so other programs can follow along
+    def __init__(self, files, fmt="tsv", progress=False, stdout=None, stderr=None):
+        self.files = files
+        self.fmt = fmt
+        self.show_progress = progress
+        self.stdout = stdout or sys.stdout
+        self.stderr = stderr or sys.stderr
+        self.records = []   #only kept for the single json document
+        self.lock = threading.Lock()
+        self.closed = False #the reader of stdout went away, nothing more is written to it
+        if fmt == "tsv":
+            with self.lock:
+                self._write("\t".join(FIELDS) + "\n")
+
+    def _write(self, text, flush=False):
+        #called with the lock held
+        if self.closed:
+            return
+        try:
+            self.stdout.write(text)
+            if flush:
+                self.stdout.flush()
+        except BrokenPipeError:
+            #the reader stopped early (museamp scan ... | head), the job itself still finishes
+            self.closed = True
+            try:
+                #so the flush at exit doesn't raise again
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, self.stdout.fileno())
+                os.close(devnull)
+            except (OSError, ValueError):
+                pass
+
+    def results(self, updates):
+        #called from worker threads with batches of (idx, loudness, replaygain, clipping[, peak])
+        with self.lock:
+            for idx, *values in updates:
+                record = _record(self.files[idx], *values)
+                if self.fmt == "json":
+                    self.records.append(record)
+                elif self.fmt == "jsonl":
+                    self._write(json.dumps(record) + "\n")
+                else:
+                    numbers = ["-" if record[f] is None else f"{record[f]:.2f}" for f in ("loudness_lufs", "gain_db")]
+                    self._write("\t".join([record["file"]] + numbers + [values[2]]) + "\n")
+            self._write("", flush=True)
+
+    def progress(self, percent):
+        if self.show_progress:
+            with self.lock:
+                self.stderr.write(json.dumps({"progress": percent}) + "\n")
+                self.stderr.flush()
+
+    def finish(self, error_logs):
+        with self.lock:
+            if self.fmt == "json":
+                self._write(json.dumps({"results": self.records, "errors": error_logs}, indent=2) + "\n")
+            elif self.show_progress:
+                for error in error_logs:
+                    self.stderr.write(json.dumps({"error": error}) + "\n")
+            else:
+                for error in error_logs:
+                    self.stderr.write(error.rstrip("\n") + "\n")
+            self._write("", flush=True)
+            self.stderr.flush()
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="museamp",
+        description="Normalize audio loudness with ReplayGain tags or by applying gain. Run without arguments to open the gui."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("paths", nargs="+", help="audio files and/or folders")
+    common.add_argument("--no-recursive", action="store_true", help="don't search subfolders of given folders")
+    common.add_argument("-j", "--jobs", type=int, default=None, help="files processed at once (default: one per cpu core)")
+    common.add_argument("--batch", action="store_true", help="pass many files to each rsgain call")
+    common.add_argument("--per-device", action="store_true",
+                        help="tune how many files are processed at once separately for each disk/mount")
+    common.add_argument("--format", choices=["tsv", "json", "jsonl"], default="tsv", help="output format (default: tsv)")
+    common.add_argument("--progress", action="store_true", help="write json progress lines to stderr")
+    common.add_argument("--trace", metavar="FILE", default=None,
+                        help="write per-file/per-stage timings as chrome trace json (also MUSEAMP_TRACE=FILE)")
+    common.add_argument("--profile", metavar="DIR", default=None,
+                        help="write a cProfile dump of the run to this folder (also MUSEAMP_PROFILE=DIR)")
+
+    target = argparse.ArgumentParser(add_help=False)
+    target.add_argument("-l", "--lufs", type=float, default=18.0, help="target loudness in -LUFS (default: 18)")
+    target.add_argument("-m", "--limiter", type=float, default=0.0, help="peak limit in -dB (default: 0.0)")
+    target.add_argument("-o", "--output-dir", default=None, help="write modified copies here instead of changing files in place")
+
+    scan = commands.add_parser("scan", parents=[common], help="read loudness without changing files")
+    scan.add_argument("--easy", action="store_true", help="let rsgain's easy mode scan whole folders")
+    scan.add_argument("--engine", choices=["rsgain", "native"], default="rsgain",
+                      help="measure with rsgain or in-process with numpy/scipy (default: rsgain)")
+    scan.add_argument("--no-cache", action="store_true", help="don't use or update the analysis cache")
+    scan.add_argument("--read-tags", action="store_true",
+                      help="use existing ReplayGain/R128 tags and only decode files without them")
+
+    tag = commands.add_parser("tag", parents=[common, target], help="analyze files and write ReplayGain tags")
+    tag.add_argument("--keep-existing", action="store_true", help="skip files that already have ReplayGain tags")
+    tag.add_argument("--no-cache", action="store_true", help="don't use or update the analysis cache")
+
+    gain = commands.add_parser("apply-gain", parents=[common, target], help="change the volume of the audio itself")
+    gain.add_argument("--engine", choices=["rsgain", "native"], default="rsgain",
+                      help="measure with rsgain or in-process with numpy/scipy (default: rsgain)")
+    gain.add_argument("--no-cache", action="store_true", help="don't use or update the analysis cache")
+    gain.add_argument("--reencode-mp3", action="store_true", help="re-encode mp3s instead of changing them losslessly")
+    return parser
+
+def _open_cache(args):
+    if getattr(args, "no_cache", True):
+        return None
+    try:
+        from .cache import AnalysisCache
+        return AnalysisCache()
+    except Exception:
+        return None
+
+def run(args, stdout=None, stderr=None):
+    #run one parsed command, returns the exit status
+    if args.trace:
+        trace.enable(args.trace)
+    if args.profile:
+        trace.enable_profile(args.profile)
+    files, walk_errors = expand_paths(args.paths, not args.no_recursive)
+    output = Output(files, args.format, args.progress, stdout, stderr)
+    batch_size = DEFAULT_BATCH_SIZE if args.batch else 1
+    cache = _open_cache(args)
+    try:
+        if args.command == "scan":
+            folders = [p for p in args.paths if os.path.isdir(p)]
+            error_logs = scan_files(
+                files, jobs=args.jobs, cache=cache, batch_size=batch_size,
+                folders=folders, backend="easy" if args.easy and not args.no_recursive else "custom", engine=args.engine,
+                read_tags=args.read_tags, per_device=args.per_device,
+                on_results=output.results, on_progress=output.progress
+            )
+        elif args.command == "tag":
+            error_logs = tag_files(
+                files, args.lufs, args.limiter,
+                create_modified=bool(args.output_dir), output_dir=args.output_dir,
+                overwrite_rg=not args.keep_existing, jobs=args.jobs, cache=cache, batch_size=batch_size,
+                per_device=args.per_device, on_results=output.results, on_progress=output.progress
+            )
+        else:
+            error_logs = apply_gain(
+                files, args.lufs, args.limiter,
+                create_modified=bool(args.output_dir), output_dir=args.output_dir,
+                jobs=args.jobs, batch_size=batch_size, lossless_mp3=not args.reencode_mp3, engine=args.engine, cache=cache,
+                per_device=args.per_device, on_results=output.results, on_progress=output.progress
+            )
+    finally:
+        if cache is not None:
+            cache.close()
+    error_logs = walk_errors + error_logs
+    output.finish(error_logs)
+    return 1 if error_logs else 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        #no arguments: open the gui, qt is only imported here
+        from .main import main as gui_main
+        return gui_main()
+    args = build_parser().parse_args(argv)
+    sys.exit(run(args))
@@ -0,0 +1,205 @@
+#content identity of audio files, so copies of the same audio (compilations, re-rips, museamp_modified
+#outputs with other tags) are only analyzed once
+import hashlib
+import os
+import struct
+import threading
+from collections import defaultdict
+from .pool import run_parallel
+
+#read size while hashing audio payloads
+HASH_CHUNK = 1 << 20
+
+def _flac(f, size):
+    #(key, payload ranges) from the STREAMINFO block, the key is the md5 of the decoded audio if the
+    #encoder stored one, otherwise just the payload size
+    if f.read(4) != b"fLaC":
+        return None
+    pos = 4
+    md5 = None
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return None
+        last = header[0] & 0x80
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:], "big")
+        if block_type == 0:
+            info = f.read(length)
+            if len(info) < 34:
+                return None
+            samples = int.from_bytes(info[13:18], "big") & 0xFFFFFFFFF
+            md5 = (info[18:34].hex(), samples)
+            f.seek(pos + 4 + length)
+        else:
+            f.seek(length, os.SEEK_CUR)
+        pos += 4 + length
+        if last:
+            break
+    if md5 is not None and md5[0] != "0" * 32:
+        return ("flac-md5",) + md5, None
+    return ("payload", ".flac", size - pos), [(pos, size)]
+
+def _mp3(f, size):
+    #audio frames between a leading id3v2 tag and trailing apev2/id3v1 tags
+    start = 0
+    header = f.read(10)
+    if header[:3] == b"ID3" and len(header) == 10:
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+    end = size
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b"TAG":
+            end -= 128
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b"APETAGEX":
+            tag_size, _, flags = struct.unpack("<III", footer[12:24])
+            end -= tag_size + (32 if flags & 0x80000000 else 0)
+    if end <= start:
+        return None
+    return ("payload", ".mp3", end - start), [(start, end)]
+
+def _mp4(f, size):
+    #contents of the top level mdat atoms, the metadata lives in moov
+    ranges = []
+    pos = 0
+    while pos + 8 <= size:
+        f.seek(pos)
+        length, name = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if length == 1:
+            length = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif length == 0:
+            length = size - pos
+        if length < header:
+            return None
+        if name == b"mdat":
+            ranges.append((pos + header, min(size, pos + length)))
+        pos += length
+    if not ranges:
+        return None
+    return ("payload", ".m4a", sum(end - start for start, end in ranges)), ranges
+
+_READERS = {".flac": _flac, ".mp3": _mp3, ".m4a": _mp4, ".mp4": _mp4}
+
+def audio_key(path):
+    """
+    Cheap identity from the file's headers: (key, ranges), or None if it can't be read.
+    A "flac-md5" key identifies the audio by itself. A "payload" key only tells which files
+    could hold the same audio, hash_payload(path, ranges) settles it.
+    """
+    reader = _READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        return None
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            return reader(f, size)
+    except (OSError, struct.error):
+        return None
+
+def hash_payload(path, ranges):
+    #blake2b of the audio payload, tags aren't part of it so retagged copies hash the same
+    digest = hashlib.blake2b(digest_size=20)
+    try:
+        with open(path, "rb") as f:
+            for start, end in ranges:
+                f.seek(start)
+                left = end - start
+                while left > 0:
+                    chunk = f.read(min(HASH_CHUNK, left))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    left -= len(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def duplicate_fingerprints(paths, jobs=None):
+    """
+    Return {path: fingerprint} for the files in paths whose audio is identical to at least one
+    other file in paths; files without a duplicate are left out. Only the headers are read,
+    except for files whose audio payload has the same size as another's, which are hashed.
+    """
+    keys = dict(run_parallel(audio_key, list(dict.fromkeys(paths)), jobs))
+    groups = defaultdict(list)
+    for path, found in keys.items():
+        if found is not None:
+            groups[found[0]].append(path)
+    fingerprints = {}
+    to_hash = []
+    for key, members in groups.items():
+        if len(members) < 2:
+            continue
+        if key[0] == "flac-md5":
+            fingerprints.update((path, key) for path in members)
+        else:
+            to_hash.extend(members)
+    hashes = defaultdict(list)
+    for path, digest in run_parallel(lambda path: hash_payload(path, keys[path][1]), to_hash, jobs):
+        if digest is not None:
+            hashes[(keys[path][0], digest)].append(path)
+    for key, members in hashes.items():
+        if len(members) > 1:
+            fingerprints.update((path, key) for path in members)
+    return fingerprints
+
+class SharedAnalysis:
+    """
+    Wraps analyze(paths) -> (results, errors) so that files with the same fingerprint are only
+    analyzed once: the first batch to reach a fingerprint analyzes it, later ones (in any thread)
+    wait for and reuse its result. Call it with the paths to analyze and, if those are copies,
+    the source paths the fingerprints were taken from.
+    """
+
+    def __init__(self, analyze, fingerprints):
+        self.analyze = analyze
+        self.fingerprints = fingerprints
+        self.results = {}   #fingerprint -> (result or None, error text)
+        self.running = {}   #fingerprint -> Event set once its result is stored
+        self.lock = threading.Lock()
+
+    def __call__(self, paths, sources=None):
+        sources = sources or paths
+        plain = []
+        owned = []
+        shared = []
+        with self.lock:
+            for path, source in zip(paths, sources):
+                fingerprint = self.fingerprints.get(source)
+                if fingerprint is None:
+                    plain.append(path)
+                elif fingerprint in self.results or fingerprint in self.running:
+                    shared.append((path, fingerprint))
+                else:
+                    self.running[fingerprint] = threading.Event()
+                    owned.append((path, fingerprint))
+        results = {}
+        errors = {}
+        try:
+            results, errors = self.analyze(plain + [path for path, _ in owned])
+        finally:
+            #always release waiters, a failed analysis shows up as an error for every copy
+            with self.lock:
+                for path, fingerprint in owned:
+                    self.results[fingerprint] = (results.get(path), errors.get(path, ""))
+                    self.running.pop(fingerprint).set()
+        results = dict(results)
+        errors = dict(errors)
+        #owned fingerprints were stored before waiting, so two batches can't wait on each other
+        for path, fingerprint in shared:
+            with self.lock:
+                event = self.running.get(fingerprint)
+            if event is not None:
+                event.wait()
+            result, error = self.results[fingerprint]
+            if result is not None:
+                results[path] = result
+            else:
+                errors[path] = error
+        return results, errors
@@ -3,14 +3,20 @@ import os
 from pathlib import Path
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QPushButton, QFileDialog, QProgressBar, QMessageBox,
-    QTableWidget, QTableWidgetItem, QAbstractItemView, QHBoxLayout, QHeaderView,
+    QTableView, QAbstractItemView, QHBoxLayout, QHeaderView,
     QLineEdit, QLabel, QDialog, QTextEdit, QDialogButtonBox, QCheckBox,
     QApplication
 )
 from PySide6.QtGui import QIntValidator, QDoubleValidator, QIcon
-from PySide6.QtCore import Qt, QThread
-from .workers import Worker, AddFilesWorker, ApplyGainWorker
-from .utils import find_supported_files
+from PySide6.QtCore import Qt, QThread, QTimer, QSize, Signal
+from .workers import Worker, AddFilesWorker, ApplyGainWorker, FolderScanWorker, FolderWatcher
+from .model import TrackTableModel
+from .rsgain import run_rsgain, DEFAULT_BATCH_SIZE
+from .pool import default_jobs
+from .cache import AnalysisCache
+from .journal import JobJournal, find_unfinished, discard
+from .tags import tag_result
+from .thumbnails import ThumbnailService
 
 #supported filetypes for museamp
 supported_filetypes = {".flac", ".mp3", ".m4a"}
@@ -40,6 +46,9 @@ class ErrorLogDialog(QDialog):
         clipboard.setText(self.text_edit.toPlainText())
 
 class AudioToolGUI(QWidget):
+    #asks the folder watcher (on its own thread) to start watching a folder
+    watch_root_requested = Signal(str, bool)
+
     def __init__(self):
         super().__init__()
         #set main window properties
@@ -47,19 +56,27 @@ class AudioToolGUI(QWidget):
         self.setMinimumSize(700, 500)
         self.layout = QVBoxLayout(self)  #main vertical layout
 
-        #file info table setup
-        self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(["File Path", "Extension", "File Loudness", "ReplayGain", "Clipping"])
+        #file info table setup, the model holds the rows and the view only draws the visible ones
+        self.model = TrackTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)    #make cells read-only
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)   #select entire rows
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive) #let user resize columns
         self.table.horizontalHeader().setStretchLastSection(True) #stretch last column to fill space
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)  #uniform rows, no per-row size queries
+        self.table.setWordWrap(False)
+        #cover art next to each path, loaded in the background for the rows on screen
+        self.thumbnails = ThumbnailService(parent=self)
+        self.model.set_thumbnails(self.thumbnails)
+        self.table.setIconSize(QSize(24, 24))
 
         #buttons
         self.add_files_btn = QPushButton("Add File(s)")
         self.add_folder_btn = QPushButton("Add Folder")
         self.remove_files_btn = QPushButton("Remove File(s)")
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setEnabled(False)  #only used while a folder is being read
         self.gain_btn = QPushButton("Apply Gain")
         self.replaygain_btn = QPushButton("Analyze && Tag")
 
@@ -79,6 +96,14 @@ class AudioToolGUI(QWidget):
         self.limiter_input.setText("0.0") #default limiter value (positive version)
         self.limiter_input.setValidator(QDoubleValidator(0.0, 10.0, 1, self))  #allow 0.0 to 10.0 with 1 decimal
 
+        #label for number of files processed at once
+        self.jobs_label = QLabel("Jobs:")
+        #textbox for parallel job count input
+        self.jobs_input = QLineEdit()
+        self.jobs_input.setFixedWidth(50) #fix width for neatness
+        self.jobs_input.setText(str(default_jobs())) #default to one job per cpu core
+        self.jobs_input.setValidator(QIntValidator(1, 256, self))  #allow 1 to 256
+
         #add checkbox for "create copy of file(s)"
         self.create_modified_checkbox = QCheckBox("Create copy of file(s) instead of modifying in-place")
         self.create_modified_checkbox.setChecked(False)
@@ -88,18 +113,43 @@ class AudioToolGUI(QWidget):
         self.search_subfolders_checkbox = QCheckBox("Search subfolders")
         self.search_subfolders_checkbox.setChecked(True)
 
+        #add checkbox for analyzing folders as they are added, using rsgain's own directory scanner
+        self.analyze_folders_checkbox = QCheckBox("Analyze added folders")
+        self.analyze_folders_checkbox.setChecked(False)
+
+        #add checkbox for filling the table from existing replaygain tags, only untagged files get decoded
+        self.read_tags_checkbox = QCheckBox("Use existing tags")
+        self.read_tags_checkbox.setChecked(True)
+
+        #add checkbox for watching added folders and tagging new or changed files automatically
+        self.watch_folders_checkbox = QCheckBox("Watch added folders")
+        self.watch_folders_checkbox.setChecked(False)
+        self.folder_watcher = None  #started when the first folder is watched
+        self.watch_queue = []   #changed files waiting for the ui to be free
+        self.watch_retry_pending = False
+
+        #add checkbox for passing many files to each rsgain call (faster for lots of short tracks)
+        self.batch_checkbox = QCheckBox("Batch rsgain calls")
+        self.batch_checkbox.setChecked(False)
+
+        #button to drop all cached analysis results
+        self.clear_cache_btn = QPushButton("Clear Cache")
+        self.analysis_cache = None  #opened on first use
+
         #layout for lufs label + input
         self.replaygain_layout = QHBoxLayout()
         self.replaygain_layout.addWidget(self.replaygain_label)
         self.replaygain_layout.addWidget(self.replaygain_input)
         self.replaygain_layout.addWidget(self.limiter_label)
         self.replaygain_layout.addWidget(self.limiter_input)
+        self.replaygain_layout.addWidget(self.jobs_label)
+        self.replaygain_layout.addWidget(self.jobs_input)
 
         #horizontal layout for buttons
         self.button_layout = QHBoxLayout()
         for btn in [
             self.add_files_btn, self.add_folder_btn,
-            self.remove_files_btn, self.gain_btn, self.replaygain_btn
+            self.remove_files_btn, self.gain_btn, self.replaygain_btn, self.cancel_btn
         ]:
             self.button_layout.addWidget(btn)
 
@@ -108,6 +158,11 @@ class AudioToolGUI(QWidget):
         self.options_layout.addLayout(self.replaygain_layout)
         self.options_layout.addWidget(self.create_modified_checkbox)
         self.options_layout.addWidget(self.search_subfolders_checkbox)
+        self.options_layout.addWidget(self.analyze_folders_checkbox)
+        self.options_layout.addWidget(self.read_tags_checkbox)
+        self.options_layout.addWidget(self.watch_folders_checkbox)
+        self.options_layout.addWidget(self.batch_checkbox)
+        self.options_layout.addWidget(self.clear_cache_btn)
         self.options_layout.addStretch(1)
 
         #progress bar defaulting to 100
@@ -129,6 +184,16 @@ class AudioToolGUI(QWidget):
         self.remove_files_btn.clicked.connect(self.remove_files)
         self.replaygain_btn.clicked.connect(self.analyze_and_tag)
         self.gain_btn.clicked.connect(self.apply_gain_adjust)
+        self.clear_cache_btn.clicked.connect(self.clear_cache)
+        self.cancel_btn.clicked.connect(self.cancel_folder_scan)
+        #measured rows follow the target and limiter as they are typed, nothing is decoded again
+        self.replaygain_input.textChanged.connect(self.retarget_table)
+        self.limiter_input.textChanged.connect(self.retarget_table)
+        self.watch_folders_checkbox.toggled.connect(self._on_watch_folders_toggled)
+
+        #offer to resume a run that was interrupted last time, once the window is up
+        self.active_journal = None
+        QTimer.singleShot(0, self.check_unfinished_jobs)
 
     #add files to table/list
     def add_files(self):
@@ -137,29 +202,15 @@ class AudioToolGUI(QWidget):
             return
         self.set_ui_enabled(False)
         self.set_progress(0)
-        files_to_add = []
-        for file_path in files:
-            if not self.is_already_listed(file_path):
-                files_to_add.append(file_path)
-        #insert rows now, do not scan yet, just set "-" for columns
-        for file_path in files_to_add:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(str(file_path)))
-            self.table.setItem(row, 1, QTableWidgetItem(Path(file_path).suffix.lower()))
-            self.table.setItem(row, 2, QTableWidgetItem("-"))
-            self.table.setItem(row, 3, QTableWidgetItem("-"))
-            self.table.setItem(row, 4, QTableWidgetItem("-"))
+        #insert rows now, do not scan yet, already listed files are skipped by the model
+        self.model.add_files(files)
         self.set_ui_enabled(True)
         self.set_progress(100)
 
     #what to do when files are finished being added
-    def _on_add_files_finished(self, updates, error_logs, start_row):
-        for idx, loudness_val, replaygain_val, clipping_val in updates:
-            row = start_row + idx
-            self.table.setItem(row, 2, QTableWidgetItem(loudness_val))
-            self.table.setItem(row, 3, QTableWidgetItem(replaygain_val))
-            self.table.setItem(row, 4, QTableWidgetItem(clipping_val))
+    def _on_add_files_finished(self, error_logs):
+        #rows filled from tags come back with the gain for -18 lufs
+        self.retarget_table()
         self.set_ui_enabled(True)
         self.set_progress(100)
         if error_logs:
@@ -173,26 +224,197 @@ class AudioToolGUI(QWidget):
             return
         self.set_ui_enabled(False)
         self.set_progress(0)
-        already_listed = {self.table.item(row, 0).text() for row in range(self.table.rowCount())}
-        #use utility to find supported files
-        files_to_add = find_supported_files(
-            folder,
+        #walk the folder in the background, rows show up in batches while it runs
+        self.folder_scan_added = []
+        self.folder_scan_cancelled = False
+        self.scan_thread = QThread()
+        self.scan_worker = FolderScanWorker(
+            [folder],
             supported_filetypes,
-            recursive=self.search_subfolders_checkbox.isChecked(),
-            already_listed=already_listed
+            recursive=self.search_subfolders_checkbox.isChecked()
         )
-        #insert items into rows now, do not scan yet, just set "-" for columns
-        start_row = self.table.rowCount()
-        for file_path in files_to_add:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(str(file_path)))
-            self.table.setItem(row, 1, QTableWidgetItem(Path(file_path).suffix.lower()))
-            self.table.setItem(row, 2, QTableWidgetItem("-"))
-            self.table.setItem(row, 3, QTableWidgetItem("-"))
-            self.table.setItem(row, 4, QTableWidgetItem("-"))
+        self.scan_worker.moveToThread(self.scan_thread)
+        self.scan_thread.started.connect(self.scan_worker.run)
+        self.scan_worker.files.connect(self._on_folder_files_found)
+        self.scan_worker.finished.connect(
+            lambda error_logs: self._on_folder_scan_finished(error_logs, folder)
+        )
+        self.scan_worker.finished.connect(self.scan_thread.quit)
+        self.scan_worker.finished.connect(self.scan_worker.deleteLater)
+        self.scan_thread.finished.connect(self.scan_thread.deleteLater)
+        self.cancel_btn.setEnabled(True)
+        self.scan_thread.start()
+
+    #insert a batch of files found by the folder walk, the model skips files that are already listed
+    def _on_folder_files_found(self, paths):
+        _, added = self.model.add_files(paths)
+        self.folder_scan_added.extend(added)
+        self.progress_bar.setFormat(f"{len(self.folder_scan_added)} files found")
+
+    #stop the folder walk, files already added stay in the table
+    def cancel_folder_scan(self):
+        self.folder_scan_cancelled = True
+        self.cancel_btn.setEnabled(False)
+        #called directly, a queued slot would wait behind the walk on the worker thread
+        self.scan_worker.cancel()
+
+    #what to do when the folder walk is done
+    def _on_folder_scan_finished(self, error_logs, folder):
+        self.cancel_btn.setEnabled(False)
+        if error_logs:
+            dlg = ErrorLogDialog("\n\n".join(error_logs), self)
+            dlg.exec()
+        files_to_add = self.folder_scan_added
+        if not self.folder_scan_cancelled and self.watch_folders_checkbox.isChecked():
+            self.watch_folder(folder, self.search_subfolders_checkbox.isChecked())
+        if self.folder_scan_cancelled or not files_to_add or not self.analyze_folders_checkbox.isChecked():
+            self.set_ui_enabled(True)
+            self.set_progress(100)
+            return
+
+        #scan the new rows in the background, whole folder trees go through rsgain's easy mode
+        recursive = self.search_subfolders_checkbox.isChecked()
+        self.set_progress(0)
+        self.add_worker_thread = QThread()
+        self.add_worker = AddFilesWorker(
+            files_to_add,
+            jobs=self.get_jobs(),
+            cache=self.get_cache(),
+            batch_size=self.get_batch_size(),
+            folders=[folder],
+            backend="easy" if recursive else "custom",
+            read_tags=self.read_tags_checkbox.isChecked()
+        )
+        self.add_worker.moveToThread(self.add_worker_thread)
+        self.add_worker_thread.started.connect(self.add_worker.run)
+        self.add_worker.progress.connect(self.set_progress)
+        #rows coming back from the worker index into the files it was given
+        self.add_worker.results.connect(lambda updates: self._on_file_results(updates, files_to_add))
+        self.add_worker.finished.connect(self._on_add_files_finished)
+        self.add_worker.finished.connect(self.add_worker_thread.quit)
+        self.add_worker.finished.connect(self.add_worker.deleteLater)
+        self.add_worker_thread.finished.connect(self.add_worker_thread.deleteLater)
+        self.add_worker_thread.start()
+
+    #start watching a folder for new or changed files
+    def watch_folder(self, folder, recursive=True):
+        if self.folder_watcher is None:
+            self.watch_thread = QThread()
+            self.folder_watcher = FolderWatcher(supported_filetypes)
+            self.folder_watcher.moveToThread(self.watch_thread)
+            self.watch_thread.started.connect(self.folder_watcher.start)
+            self.watch_root_requested.connect(self.folder_watcher.add_root)
+            self.folder_watcher.changed.connect(self._on_watched_files_changed)
+            self.folder_watcher.errors.connect(self._on_watch_errors)
+            self.watch_thread.finished.connect(self.folder_watcher.deleteLater)
+            self.watch_thread.finished.connect(self.watch_thread.deleteLater)
+            self.watch_thread.start()
+        self.watch_root_requested.emit(str(folder), recursive)
+
+    #stop watching all folders
+    def stop_watching(self):
+        if self.folder_watcher is None:
+            return
+        self.watch_root_requested.disconnect(self.folder_watcher.add_root)
+        self.folder_watcher = None
+        self.watch_queue = []
+        self.watch_thread.quit()
+        self.watch_thread.wait()
+
+    def _on_watch_folders_toggled(self, checked):
+        if not checked:
+            self.stop_watching()
+
+    def _on_watch_errors(self, error_logs):
+        dlg = ErrorLogDialog("\n\n".join(error_logs), self)
+        dlg.exec()
+
+    #queue files reported by the watcher and tag them as soon as nothing else is running
+    def _on_watched_files_changed(self, paths):
+        if self.folder_watcher is None:
+            return
+        self.watch_queue.extend(paths)
+        self._start_watch_tagging()
+
+    def _retry_watch_tagging(self):
+        self.watch_retry_pending = False
+        self._start_watch_tagging()
+
+    def _start_watch_tagging(self):
+        if not self.watch_queue or self.folder_watcher is None:
+            return
+        #the ui is disabled while any other job runs, try again a bit later
+        if not self.replaygain_btn.isEnabled():
+            if not self.watch_retry_pending:
+                self.watch_retry_pending = True
+                QTimer.singleShot(1000, self._retry_watch_tagging)
+            return
+        try:
+            lufs = int(self.replaygain_input.text())
+            limiter = float(self.limiter_input.text())
+        except Exception:
+            lufs, limiter = 18, 0.0
+        create_modified = self.create_modified_checkbox.isChecked()
+        output_dir = self.create_modified_folder if create_modified else None
+        files, self.watch_queue = self.watch_queue, []
+        if create_modified:
+            #copies land in a museamp_modified folder, inside the watched tree when no folder was picked;
+            #tagging those again would copy them once more, forever
+            copies = [f for f in files if Path(f).parent.name == "museamp_modified"]
+            if copies:
+                self.folder_watcher.done(copies)
+                files = [f for f in files if Path(f).parent.name != "museamp_modified"]
+                if not files:
+                    return
+        self.model.add_files(files)
+        self.set_ui_enabled(False)
+        self.set_progress(0)
+
+        self.watch_worker_thread = QThread()
+        self.watch_worker = Worker(
+            files, lufs, limiter,
+            create_modified=create_modified,
+            jobs=self.get_jobs(),
+            cache=self.get_cache(),
+            batch_size=self.get_batch_size()
+        )
+        self.watch_worker.output_dir = output_dir
+        self.watch_worker.overwrite_rg = True
+        self.watch_worker.moveToThread(self.watch_worker_thread)
+        self.watch_worker_thread.started.connect(self.watch_worker.run)
+        self.watch_worker.progress.connect(self.set_progress)
+        self.watch_worker.results.connect(lambda updates: self._on_file_results(updates, files))
+        self.watch_worker.finished.connect(
+            lambda error_logs: self._on_watch_tagging_finished(error_logs, files)
+        )
+        self.watch_worker.finished.connect(self.watch_worker_thread.quit)
+        self.watch_worker.finished.connect(self.watch_worker.deleteLater)
+        self.watch_worker_thread.finished.connect(self.watch_worker_thread.deleteLater)
+        self.watch_worker_thread.start()
+
+    #worker rows index into files, map them back to table rows (rows may have been removed meanwhile)
+    def _on_file_results(self, updates, files):
+        rows = [(self.model.row(files[idx]), values) for idx, *values in updates]
+        self.model.set_results([(row,) + tuple(values) for row, values in rows if row is not None])
+
+    #no completion popup here, watch mode runs unattended
+    def _on_watch_tagging_finished(self, error_logs, files):
+        if self.folder_watcher is not None:
+            self.folder_watcher.done(files)
         self.set_ui_enabled(True)
         self.set_progress(100)
+        if error_logs:
+            dlg = ErrorLogDialog("\n\n".join(error_logs), self)
+            dlg.exec()
+        self._start_watch_tagging()
+
+    def closeEvent(self, event):
+        self.stop_watching()
+        #leave the journal of a run that is still going on disk so it can be resumed next time
+        if self.active_journal is not None:
+            self.active_journal.close()
+        self.thumbnails.close()
+        super().closeEvent(event)
 
     #actually add file to the table/list (used for single file add)
     def add_file_to_table(self, file_path):
@@ -202,65 +424,26 @@ class AudioToolGUI(QWidget):
         if self.is_already_listed(str(path)):
             return
 
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-        self.table.setItem(row, 0, QTableWidgetItem(str(path))) #file path
-        self.table.setItem(row, 1, QTableWidgetItem(path.suffix.lower()))   #extension
-
-        #scan for existing replaygain tags
-        loudness_val = "-"
-        replaygain_val = "-"
-        clipping_val = "-"
-        try:
-            cmd = [
-                "rsgain", "custom",
-                "-O",
-                str(path)
-            ]
-            proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            output = proc.stdout
-            if proc.returncode == 0:
-                lines = output.strip().splitlines()
-                if len(lines) >= 2:
-                    header = lines[0].split('\t')
-                    values = lines[1].split('\t')
-                    colmap = {k: i for i, k in enumerate(header)}
-                    lufs = values[colmap.get("Loudness (LUFS)", -1)] if "Loudness (LUFS)" in colmap else "-"
-                    gain = values[colmap.get("Gain (dB)", -1)] if "Gain (dB)" in colmap else "-"
-                    if lufs != "-":
-                        loudness_val = f"{lufs} LUFS"
-                    if gain != "-":
-                        replaygain_val = gain
-                    #clipping: check "Clipping" or "Clipping Adjustment?" column from rsgain
-                    clip_idx = colmap.get("Clipping", colmap.get("Clipping Adjustment?", -1))
-                    if clip_idx != -1:
-                        clip_val = values[clip_idx]
-                        if clip_val.strip().upper() in ("Y", "YES"):
-                            clipping_val = "Yes"
-                        elif clip_val.strip().upper() in ("N", "NO"):
-                            clipping_val = "No"
-                        else:
-                            clipping_val = clip_val
-        except Exception:
-            pass
+        row, _ = self.model.add_files([str(path)])
 
+        #read existing replaygain tags, decoding with rsgain only when there aren't any
+        result = tag_result(str(path)) if self.read_tags_checkbox.isChecked() else None
+        if result is None:
+            results, _ = run_rsgain([], [str(path)])
+            #rsgain's default scan reports sample peaks, the row can't be re-targeted from those
+            result = results.get(str(path), ("-", "-", "-", None))[:3]
         #set values in table
-        self.table.setItem(row, 2, QTableWidgetItem(loudness_val))
-        self.table.setItem(row, 3, QTableWidgetItem(replaygain_val))
-        self.table.setItem(row, 4, QTableWidgetItem(clipping_val))
+        self.model.set_results([(row,) + tuple(result)])
+        self.retarget_table()
 
     #check if file is already listed in the table/list
     def is_already_listed(self, filepath):
-        for row in range(self.table.rowCount()):
-            if self.table.item(row, 0).text() == filepath:
-                return True
-        return False
+        return self.model.contains(filepath)
 
     #remove selected files from the table/list
     def remove_files(self):
-        selected_rows = sorted({item.row() for item in self.table.selectedItems()}, reverse=True)
-        for row in selected_rows:
-            self.table.removeRow(row)
+        selected_rows = [index.row() for index in self.table.selectionModel().selectedRows()]
+        self.model.remove_rows(selected_rows)
 
     #disable/enable all ui elements except the progress bar
     def set_ui_enabled(self, enabled: bool):
@@ -271,14 +454,50 @@ class AudioToolGUI(QWidget):
         self.replaygain_btn.setEnabled(enabled)
         self.replaygain_input.setEnabled(enabled)
         self.limiter_input.setEnabled(enabled)
+        self.jobs_input.setEnabled(enabled)
+        self.clear_cache_btn.setEnabled(enabled)
         self.table.setEnabled(enabled)
 
-    #update table with results from worker
-    def update_table_with_worker(self, updates):
-        for row, loudness_val, replaygain_val, clipping_val in updates:
-            self.table.setItem(row, 2, QTableWidgetItem(loudness_val))
-            self.table.setItem(row, 3, QTableWidgetItem(replaygain_val))
-            self.table.setItem(row, 4, QTableWidgetItem(clipping_val))
+    #recompute gain and clipping of the measured rows for the current target lufs and limiter
+    def retarget_table(self):
+        try:
+            lufs = int(self.replaygain_input.text())
+            limiter = float(self.limiter_input.text())
+        except ValueError:
+            return
+        self.model.retarget(-abs(lufs), -abs(limiter))
+
+    #get number of parallel jobs from user input, falling back to one per cpu core
+    def get_jobs(self):
+        try:
+            return max(1, int(self.jobs_input.text()))
+        except Exception:
+            return default_jobs()
+
+    #number of files passed to each rsgain call
+    def get_batch_size(self):
+        return DEFAULT_BATCH_SIZE if self.batch_checkbox.isChecked() else 1
+
+    #open the persistent analysis cache, analysis still works without it if it can't be opened
+    def get_cache(self):
+        if self.analysis_cache is None:
+            try:
+                self.analysis_cache = AnalysisCache()
+            except Exception:
+                return None
+        return self.analysis_cache
+
+    #forget all cached analysis results so every file gets re-analyzed
+    def clear_cache(self):
+        cache = self.get_cache()
+        if cache is None:
+            return
+        try:
+            cache.invalidate()
+        except Exception as e:
+            QMessageBox.warning(self, "Clear Cache", f"Failed to clear the analysis cache: {e}")
+            return
+        QMessageBox.information(self, "Clear Cache", "The analysis cache has been cleared.")
 
     #set progress bar value and format
     def set_progress(self, percent):
@@ -287,9 +506,7 @@ class AudioToolGUI(QWidget):
 
     #analyze and tag files (replaygain)
     def analyze_and_tag(self):
-        files = []
-        for row in range(self.table.rowCount()):
-            files.append(self.table.item(row, 0).text())
+        files = self.model.file_paths()
         if not files:
             QMessageBox.information(self, "No Files", "No files to analyze.")
             return
@@ -338,48 +555,111 @@ class AudioToolGUI(QWidget):
             QMessageBox.warning(self, "Invalid Limiter", "Please enter a valid limiter value.")
             return
 
+        create_modified = self.create_modified_checkbox.isChecked()
+        output_dir = self.create_modified_folder if create_modified else None
+        settings = {"lufs": lufs, "limiter": limiter, "create_modified": create_modified, "output_dir": output_dir}
+        self.start_tagging(files, lufs, limiter, create_modified, output_dir, self.open_journal("tag", files, settings))
+
+    #start the analyze & tag worker, journal is None or the JobJournal recording this run
+    def start_tagging(self, files, lufs, limiter, create_modified, output_dir, journal):
         self.set_ui_enabled(False)
         self.set_progress(0)
-        for row in range(self.table.rowCount()):
-            self.table.setItem(row, 3, QTableWidgetItem("-"))
-            self.table.setItem(row, 4, QTableWidgetItem("-"))
+        self.model.clear_results((3, 4))
+        self.active_journal = journal
 
         self.worker_thread = QThread()
         self.worker = Worker(
             files, lufs, limiter,
-            create_modified=self.create_modified_checkbox.isChecked()
+            create_modified=create_modified,
+            jobs=self.get_jobs(),
+            cache=self.get_cache(),
+            batch_size=self.get_batch_size(),
+            journal=journal
         )
-        if self.create_modified_checkbox.isChecked():
-            self.worker.output_dir = self.create_modified_folder
+        self.worker.output_dir = output_dir
         self.worker.overwrite_rg = True
         self.worker.moveToThread(self.worker_thread)
         self.worker_thread.started.connect(self.worker.run)
         self.worker.progress.connect(self.set_progress)
+        self.worker.results.connect(lambda updates: self._on_file_results(updates, files))
         self.worker.finished.connect(self._on_worker_finished_tag)
         self.worker.finished.connect(self.worker_thread.quit)
         self.worker.finished.connect(self.worker.deleteLater)
         self.worker_thread.finished.connect(self.worker_thread.deleteLater)
         self.worker_thread.start()
 
-    #handle completion of analyze & tag worker
-    def _on_worker_finished_tag(self, updates, error_logs):
-        #only handle the final update (not partials)
-        if not updates or not all(isinstance(u, tuple) for u in updates):
+    #start a journal for a run, the run still works without one if it can't be written
+    def open_journal(self, kind, files, settings):
+        try:
+            return JobJournal.create(kind, files, settings)
+        except Exception:
+            return None
+
+    def finish_journal(self):
+        if self.active_journal is not None:
+            self.active_journal.finish()
+            self.active_journal = None
+
+    #go through the interrupted runs newest first, each can be resumed, discarded or kept for the next start
+    #only one run can go at a time, so once one is resumed the rest are kept
+    def check_unfinished_jobs(self):
+        states = find_unfinished()
+        for number, state in enumerate(states, 1):
+            action = "Analyze & Tag" if state.kind == "tag" else "Apply Gain"
+            count = f" ({number} of {len(states)})" if len(states) > 1 else ""
+            reply = QMessageBox.question(
+                self,
+                "Resume Interrupted Run" + count,
+                f"An {action} run on {len(state.files)} files was interrupted with {len(state.done)} files done.\n\n"
+                "Yes resumes it and skips the finished files, Discard deletes it, "
+                "Ignore keeps it to ask again next time.",
+                QMessageBox.Yes | QMessageBox.Discard | QMessageBox.Ignore,
+                QMessageBox.Yes
+            )
+            if reply == QMessageBox.Yes:
+                self.resume_job(state)
+                return
+            if reply == QMessageBox.Discard:
+                discard(state.path)
+
+    #load an interrupted run's files and settings and carry on where it stopped
+    def resume_job(self, state):
+        settings = state.settings
+        lufs = settings.get("lufs", 18)
+        limiter = settings.get("limiter", 0.0)
+        create_modified = bool(settings.get("create_modified"))
+        output_dir = settings.get("output_dir")
+        self.replaygain_input.setText(str(abs(int(lufs))))
+        self.limiter_input.setText(str(abs(float(limiter))))
+        self.create_modified_checkbox.setChecked(create_modified)
+        self.create_modified_folder = output_dir
+        #the journal's results are for the job's own file list, whatever else the table holds now
+        files = list(state.files)
+        try:
+            journal = JobJournal.resume(state)
+        except OSError:
+            #another instance picked it up in the meantime
             return
-        #only show popup if all rows are updated (not "-")
-        all_done = all(isinstance(u, tuple) and all(x != "-" for x in u[1:]) for u in updates)
-        self.update_table_with_worker(updates)
-        if all_done:
-            if error_logs:
-                dlg = ErrorLogDialog("\n\n".join(error_logs), self)
-                dlg.exec()
-            QMessageBox.information(self, "Operation Complete", "Analysis and tagging have been completed.")
-            self.set_ui_enabled(True)
-            self.set_progress(100)
+        self.model.add_files(files)
+        if state.kind == "tag":
+            self.start_tagging(files, lufs, limiter, create_modified, output_dir, journal)
+        else:
+            self.start_apply_gain(files, lufs, limiter, create_modified, output_dir, journal)
+
+    #handle completion of analyze & tag worker
+    def _on_worker_finished_tag(self, error_logs):
+        #rows were already filled in as results came in
+        self.finish_journal()
+        self.set_ui_enabled(True)
+        self.set_progress(100)
+        if error_logs:
+            dlg = ErrorLogDialog("\n\n".join(error_logs), self)
+            dlg.exec()
+        QMessageBox.information(self, "Operation Complete", "Analysis and tagging have been completed.")
             
 
     def apply_gain_adjust(self):
-        files = [self.table.item(row, 0).text() for row in range(self.table.rowCount())]
+        files = self.model.file_paths()
         if not files:
             return
 
@@ -425,21 +705,31 @@ class AudioToolGUI(QWidget):
             QMessageBox.warning(self, "Invalid Limiter", "Please enter a valid limiter value.")
             return
 
+        create_modified = self.create_modified_checkbox.isChecked()
+        output_dir = self.create_modified_folder if create_modified else None
+        settings = {"lufs": lufs, "limiter": limiter, "create_modified": create_modified, "output_dir": output_dir}
+        self.start_apply_gain(files, lufs, limiter, create_modified, output_dir, self.open_journal("apply", files, settings))
+
+    #start the apply gain worker, journal is None or the JobJournal recording this run
+    def start_apply_gain(self, files, lufs, limiter, create_modified, output_dir, journal):
         self.set_ui_enabled(False)
         self.set_progress(0)
-        for row in range(self.table.rowCount()):
-            self.table.setItem(row, 3, QTableWidgetItem("-"))
-            self.table.setItem(row, 4, QTableWidgetItem("-"))
+        self.model.clear_results((3, 4))
+        self.active_journal = journal
 
         self.gain_worker_thread = QThread()
         self.gain_worker = ApplyGainWorker(
             files, lufs, limiter, self.table, supported_filetypes,
-            create_modified=self.create_modified_checkbox.isChecked()
+            create_modified=create_modified,
+            jobs=self.get_jobs(),
+            batch_size=self.get_batch_size(),
+            cache=self.get_cache(),
+            journal=journal
         )
-        if self.create_modified_checkbox.isChecked():
-            self.gain_worker.output_dir = self.create_modified_folder
+        self.gain_worker.output_dir = output_dir
         self.gain_worker.moveToThread(self.gain_worker_thread)
         self.gain_worker.progress.connect(self.set_progress)
+        self.gain_worker.results.connect(lambda updates: self._on_file_results(updates, files))
         self.gain_worker.finished.connect(self._on_apply_gain_finished)
         self.gain_worker.finished.connect(self.gain_worker_thread.quit)
         self.gain_worker.finished.connect(self.gain_worker.deleteLater)
@@ -447,12 +737,8 @@ class AudioToolGUI(QWidget):
         self.gain_worker_thread.started.connect(self.gain_worker.run)
         self.gain_worker_thread.start()
 
-    def _on_apply_gain_finished(self, error_logs, analysis_results):
-        #update the table with new analysis results after gain is applied
-        for idx, loudness_val, replaygain_val, clipping_val in analysis_results:
-            self.table.setItem(idx, 2, QTableWidgetItem(loudness_val))
-            self.table.setItem(idx, 3, QTableWidgetItem(replaygain_val))
-            self.table.setItem(idx, 4, QTableWidgetItem(clipping_val))
+    def _on_apply_gain_finished(self, error_logs):
+        self.finish_journal()
         #re-enable ui and set progress to 100%
         self.set_ui_enabled(True)
         self.set_progress(100)
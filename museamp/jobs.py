@@ -0,0 +1,622 @@
+#analysis, tagging and apply-gain jobs without any qt dependency
+#the gui workers and the command line interface are both thin wrappers around these
+import os
+import threading
+from pathlib import Path
+from .pool import run_parallel, run_pipeline, default_jobs
+from .rsgain import run_rsgain, run_rsgain_easy, make_batches
+from .utils import compute_track_gain
+from . import mp3gain
+from .probe import probe_files, duration_weights
+from .staging import stage_copy
+from .tags import tag_result, write_loudness_tags
+from .fingerprint import duplicate_fingerprints, SharedAnalysis
+from . import trace
+
+#supported file types for processing
+supported_filetypes = {".flac", ".mp3", ".m4a"}
+
+#how often finished rows are handed to the gui, in seconds
+RESULT_INTERVAL = 0.1
+
+class ResultBatcher:
+    #collects per-file results from any thread and emits them as one list at most every interval seconds
+    def __init__(self, emit, interval=RESULT_INTERVAL):
+        self.emit = emit
+        self.interval = interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def add(self, item):
+        self.extend([item])
+
+    def extend(self, items):
+        with self.lock:
+            self.pending.extend(items)
+            #the first result after a flush starts the timer, later ones just ride along
+            if self.timer is None and self.pending:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        #emit under the lock so a final flush can't be overtaken by one from the timer thread
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            batch, self.pending = self.pending, []
+            if batch:
+                with trace.span("emit results", rows=len(batch)):
+                    self.emit(batch)
+
+class ProgressReporter:
+    #only emits when the whole percent value changes, instead of once per file
+    def __init__(self, emit):
+        self.emit = emit
+        self.last = None
+
+    def update(self, done, total):
+        percent = min(100, int(done / total * 100)) if total else 100
+        if percent != self.last:
+            self.last = percent
+            self.emit(percent)
+
+def _ignore(*args):
+    pass
+
+def _lufs(loudness_val):
+    #number from a "-9.33 LUFS" table value, None for "-"
+    try:
+        return float(loudness_val.split()[0])
+    except (AttributeError, ValueError, IndexError):
+        return None
+
+def _analyzer(engine, rsgain_options, error_logs, target_lufs=-18.0, max_peak_db=0.0, clip_mode="n", true_peak=False):
+    #returns analyze(paths) -> (results, errors) for the chosen engine, both give run_rsgain's result format
+    #"native" measures in-process (numpy/scipy), rsgain is used if those aren't installed
+    if engine == "native":
+        #imported here, numpy/scipy add ~90 MB to every process that only runs rsgain
+        from . import loudness
+        if loudness.available():
+            return lambda paths: loudness.run_native(paths, target_lufs, max_peak_db, clip_mode, true_peak)
+        error_logs.append("Native loudness engine needs numpy and scipy, using rsgain instead.")
+    return lambda paths: run_rsgain(rsgain_options, paths)
+
+def _share_duplicates(analyze, paths, jobs=None):
+    #wrap analyze so copies of the same audio among paths are only analyzed once
+    with trace.span("fingerprint", files=len(paths)):
+        fingerprints = duplicate_fingerprints(paths, jobs)
+    return SharedAnalysis(analyze, fingerprints) if fingerprints else analyze
+
+def measured_result(loudness, peak, target_lufs=-18.0, max_peak_db=0.0):
+    #run_rsgain style (loudness, replaygain, clipping, peak) for a known loudness and true peak,
+    #with the gain limited like rsgain's -c p -m max_peak_db
+    gain, clipped = compute_track_gain(loudness, peak, target_lufs, max_peak_db, "p")
+    return f"{loudness:.2f} LUFS", f"{gain:.2f}", "Yes" if clipped else "No", peak
+
+def _batch_paths(batch):
+    #files read by a batch of (idx, path) items, for per_device runs
+    return [path for _, path in batch]
+
+def _file_paths(path):
+    return [path]
+
+def _resume_from_journal(items, files, journal, batcher):
+    #report files the journal already has results for and return the (idx, path) items still to do
+    if journal is None or not journal.done:
+        return list(items)
+    todo = []
+    for idx, file_path in items:
+        if file_path in journal.done:
+            batcher.add((idx,) + tuple(journal.done[file_path]))
+        else:
+            todo.append((idx, file_path))
+    return todo
+
+def _record_results(journal, files, updates):
+    #journal the files that finished successfully, failed ones are tried again on resume
+    if journal is not None:
+        journal.record([(files[idx], values) for idx, *values in updates if values[0] != "-"])
+
+def _outermost_dirs(directories):
+    #drop directories that are inside another one in the list, rsgain easy would scan them twice
+    kept = []
+    for directory in sorted(os.path.normpath(d) for d in directories):
+        if not any(directory == k or directory.startswith(k.rstrip(os.sep) + os.sep) for k in kept):
+            kept.append(directory)
+    return kept
+
+def _make_output_dir(files, output_dir=None):
+    #create the folder "create copy" output goes to, returns (output_dir, error)
+    if not output_dir:
+        if not files:
+            return None, None
+        #fallback: use default location if not set
+        output_dir = Path(files[0]).parent / "museamp_modified"
+    output_dir = Path(output_dir)
+    try:
+        output_dir.mkdir(exist_ok=True)
+    except Exception as e:
+        return None, f"Failed to create output directory '{output_dir}': {e}"
+    return output_dir, None
+
+@trace.job("tag")
+def tag_files(files, lufs=None, limiter=0.0, create_modified=False, output_dir=None, overwrite_rg=True,
+              jobs=None, cache=None, batch_size=1, journal=None, per_device=False, on_results=_ignore,
+              on_progress=_ignore):
+    """
+    Analyze files with rsgain and write ReplayGain tags to them (or to copies in output_dir
+    when create_modified is set). Tags are written with mutagen into the existing padding and
+    files whose tags already hold the values are left untouched. Files with a cached loudness
+    and true peak are tagged from those for any target and limiter without being decoded.
+    Batches of (idx, loudness, replaygain, clipping[, peak]) are passed to on_results as files
+    finish, where idx is the file's position in files and peak is the linear true peak when
+    it is known, and on_progress gets the percent complete. With a JobJournal, finished files
+    are recorded in it and files it already lists as done are reported without being processed
+    again. With per_device, each storage device the files live on gets its own adaptive share
+    of jobs.
+    Returns the list of error messages.
+    """
+    error_logs = []
+    total = len(files)
+    processed = 0
+    batcher = ResultBatcher(on_results)
+    progress = ProgressReporter(on_progress)
+
+    #copies go to output_dir, or a museamp_modified folder next to the first file
+    if create_modified:
+        output_dir, error = _make_output_dir(files, output_dir)
+        if error:
+            error_logs.append(error)
+            return error_logs
+
+    #output copies claimed so far, so two sources with the same name don't copy over each other
+    claimed_outputs = set()
+    claim_lock = threading.Lock()
+    #fractional targets are passed on as they are, whole ones keep the "-18" form of older cache entries
+    lufs_str = f"-{abs(float(lufs)):g}" if lufs is not None else "-18"
+    limiter_str = f"-{abs(float(limiter))}"
+    target_lufs = float(lufs_str)
+    max_peak_db = float(limiter_str)
+    #rsgain only measures (-s s), the tags are written below from its results
+    rsgain_options = ["-s", "s", "-l", lufs_str, "-t", "-c", "p", "-m", limiter_str]
+
+    def prepare_file(row, file_path):
+        #copy the file if needed and check the cache, returns (out_file, source, update or None, errors)
+        #source is the file out_file's audio is known to match: file_path itself, or the file it was
+        #copied from just now; an output copy left from an earlier run (gain applied since, maybe) is its own
+        ext = Path(file_path).suffix.lower()
+        if ext not in supported_filetypes:
+            return None, None, (row, "-", "-", "-"), []
+        out_file = file_path
+        source = file_path
+        if create_modified and output_dir:
+            p = Path(file_path)
+            #copy the file to the output_dir before tagging
+            out_file = str(output_dir / p.name)
+            with claim_lock:
+                needs_copy = out_file not in claimed_outputs and not Path(out_file).exists()
+                claimed_outputs.add(out_file)
+            if needs_copy:
+                try:
+                    #copy file before tagging (reflink/in-kernel copy where possible, never the whole file in memory)
+                    with trace.span("copy", file=file_path):
+                        stage_copy(file_path, out_file)
+                except Exception as e:
+                    return None, None, (row, "-", "-", "-"), [f"Failed to copy file '{file_path}' to '{out_file}': {e}"]
+            else:
+                source = out_file
+        #a valid cache entry means this exact file was already tagged with these settings
+        if cache is not None:
+            cached = cache.get(out_file, "tag", lufs_str, limiter_str)
+            if cached is not None:
+                return out_file, source, (row,) + tuple(cached[:4]), []
+        #like rsgain -S, files that already have replaygain tags are left as they are
+        if not overwrite_rg:
+            existing = tag_result(out_file, target_lufs)
+            if existing is not None:
+                return out_file, source, (row,) + tuple(existing[:4]), []
+        return out_file, source, None, []
+
+    def tag_batch(batch):
+        #analyze/tag a batch of (row, path) items with one rsgain call, returns (updates, errors)
+        updates = []
+        errors = []
+        pending = []
+        sources = {}    #out_file -> source from prepare_file
+        for row, file_path in batch:
+            with trace.span("prepare", file=file_path):
+                out_file, source, update, prep_errors = prepare_file(row, file_path)
+            errors.extend(prep_errors)
+            if update is not None:
+                updates.append(update)
+            else:
+                pending.append((row, out_file))
+                sources[out_file] = source
+        #loudness and true peak don't depend on the settings, files measured before (fresh copies under
+        #their source) only need the gain worked out for this target and limiter
+        measured = {}
+        if cache is not None:
+            for row, out_file in pending:
+                known = cache.get_measurement(sources[out_file])
+                if known is not None:
+                    measured[out_file] = measured_result(*known, target_lufs, max_peak_db)
+        to_analyze = [(row, out_file) for row, out_file in pending if out_file not in measured]
+        #outputs that weren't just copied aren't fingerprinted, so they never take a duplicate's result
+        results, failures = analyze([out_file for _, out_file in to_analyze], [sources[out_file] for _, out_file in to_analyze])
+        results.update(measured)
+        for row, out_file in pending:
+            if out_file in results:
+                result = results[out_file]
+                try:
+                    with trace.span("write tags", file=out_file):
+                        write_loudness_tags(out_file, float(result[1]), result[3], target_lufs, _lufs(result[0]))
+                except Exception as e:
+                    errors.append(f"{out_file} (tag): {e}")
+                    updates.append((row, "-", "-", "-"))
+                    continue
+                #stored after tagging, so the entry matches the file as it is now
+                if cache is not None and result[0] != "-":
+                    cache.put(out_file, "tag", lufs_str, limiter_str, result)
+                updates.append((row,) + tuple(result[:4]))
+            else:
+                errors.append(f"{out_file}:\n{failures.get(out_file, '')}")
+                updates.append((row, "-", "-", "-"))
+        return updates, errors
+
+    #results come back in completion order, the row index keeps them mapped to the table
+    todo = _resume_from_journal(enumerate(files), files, journal, batcher)
+    processed = total - len(todo)
+    #fresh copies are analyzed under their source's fingerprint, duplicates share one rsgain result
+    analyze = _share_duplicates(lambda paths, sources=None: run_rsgain(rsgain_options, paths), [f for _, f in todo], jobs)
+    batches = make_batches(todo, batch_size, lambda item: item[1])
+    for _, (batch_updates, errors) in run_parallel(tag_batch, batches, jobs, _batch_paths if per_device else None):
+        batcher.extend(batch_updates)
+        _record_results(journal, files, batch_updates)
+        error_logs.extend(errors)
+        processed += len(batch_updates)
+        progress.update(processed, total)
+    if cache is not None:
+        cache.flush()
+    batcher.flush()
+    return error_logs
+
+@trace.job("scan")
+def scan_files(files, jobs=None, cache=None, batch_size=1, folders=None, backend="custom", engine="rsgain",
+               read_tags=False, per_device=False, on_results=_ignore, on_progress=_ignore):
+    """
+    Read the loudness of files without tagging them, with rsgain or (engine "native") the
+    in-process loudness engine. With backend "easy", rsgain's own multithreaded scanner reads
+    the folder trees in folders first and only files it missed are scanned one by one.
+    With read_tags, files that already have ReplayGain (or R128) tags are filled in from those
+    and only the rest are decoded.
+    Results, progress and per_device are handled like tag_files. Returns the list of error messages.
+    """
+    folders = folders or []
+    error_logs = []
+    analyze = _analyzer(engine, [], error_logs)
+    total = len(files)
+    processed = 0
+    batcher = ResultBatcher(on_results)
+    progress = ProgressReporter(on_progress)
+
+    #reading tags is a header read per file, much cheaper than decoding it
+    tag_results = {}
+    if read_tags:
+        with trace.span("read tags", files=len(files)):
+            for file_path, result in run_parallel(tag_result, files, jobs, _file_paths if per_device else None):
+                if result is not None:
+                    tag_results[file_path] = result
+        if tag_results:
+            #only the folders holding untagged files need rsgain's scanner
+            folders = _outermost_dirs({os.path.dirname(f) for f in files if f not in tag_results})
+
+    #let rsgain walk and scan whole folders itself, anything it misses falls back to per-file calls below
+    easy_results = {}
+    if backend == "easy" and engine == "rsgain" and folders:
+        on_progress(0)
+        easy_results, error = run_rsgain_easy(folders, jobs)
+        if error:
+            error_logs.append(f"rsgain easy failed, scanning files one by one instead:\n{error}")
+    else:
+        analyze = _share_duplicates(analyze, [f for f in files if f not in tag_results], jobs)
+
+    def scan_batch(batch):
+        #scan a batch of (idx, path) items without tagging, returns (updates, errors)
+        updates = []
+        errors = []
+        pending = []
+        for idx, file_path in batch:
+            tagged = tag_results.get(file_path)
+            if tagged is not None:
+                updates.append((idx,) + tuple(tagged[:4]))
+                continue
+            path = Path(file_path)
+            if not path.is_file():
+                errors.append(f"{file_path}: Not a file")
+                updates.append((idx, "-", "-", "-"))
+                continue
+            if path.suffix.lower() not in supported_filetypes:
+                errors.append(f"{file_path}: Unsupported file type")
+                updates.append((idx, "-", "-", "-"))
+                continue
+            if cache is not None:
+                cached = cache.get(str(path), "scan")
+                if cached is not None:
+                    updates.append((idx,) + tuple(cached[:3]))
+                    continue
+            easy_result = easy_results.get(os.path.normpath(str(path)))
+            if easy_result is not None:
+                if cache is not None and easy_result[0] != "-":
+                    cache.put(str(path), "scan", None, None, easy_result)
+                updates.append((idx,) + tuple(easy_result[:3]))
+                continue
+            pending.append((idx, str(path)))
+        with trace.span("analyze", files=len(pending)):
+            results, failures = analyze([path for _, path in pending])
+        for idx, path in pending:
+            if path in results:
+                result = results[path]
+                if cache is not None and result[0] != "-":
+                    cache.put(path, "scan", None, None, result)
+                updates.append((idx,) + tuple(result[:3]))
+            else:
+                errors.append(f"{path}: rsgain failed\n{failures.get(path, '')}")
+                updates.append((idx, "-", "-", "-"))
+        return updates, errors
+
+    batches = make_batches(enumerate(files), batch_size, lambda item: item[1])
+    for _, (batch_updates, errors) in run_parallel(scan_batch, batches, jobs, _batch_paths if per_device else None):
+        batcher.extend(batch_updates)
+        error_logs.extend(errors)
+        processed += len(batch_updates)
+        progress.update(processed, total)
+    if cache is not None:
+        cache.flush()
+    batcher.flush()
+    return error_logs
+
+@trace.job("apply-gain")
+def apply_gain(files, lufs, limiter, supported_filetypes=supported_filetypes, create_modified=False, output_dir=None,
+               jobs=None, batch_size=1, analysis_jobs=None, lossless_mp3=True, engine="rsgain", cache=None,
+               journal=None, per_device=False, on_results=_ignore, on_progress=_ignore):
+    """
+    Change the volume of files so they play at lufs, keeping the peak under limiter. Each file
+    is decoded once by rsgain (or the native engine) for its measurement and then re-encoded by ffmpeg (mp3s are
+    patched losslessly when lossless_mp3 is set), with analysis and encoding overlapping.
+    Files with a cached loudness and true peak skip the measurement whatever the target and
+    limiter were. Results, progress, the journal and per_device are handled like tag_files.
+    Returns the list of error messages.
+    """
+    error_logs = []
+    #copies go to output_dir, or a museamp_modified folder next to the first file
+    if create_modified:
+        output_dir, error = _make_output_dir(files, output_dir)
+        if error:
+            error_logs.append(error)
+            return error_logs
+
+    lufs_str = f"-{abs(lufs)}"
+    limiter_str = f"-{abs(float(limiter))}"
+
+    #decode output safely for error reporting with latin1 fallback
+    def safe_decode(b):
+        try:
+            return b.decode('utf-8', errors='replace')
+        except Exception:
+            return b.decode('latin1', errors='replace')
+
+    #scan only (-s s): the source is never tagged, the measurement below is all we need
+    rsgain_options = ["-s", "s", "-l", lufs_str, "-t", "-c", "p", "-m", limiter_str]
+    target_lufs = -abs(float(lufs))
+    max_peak_db = -abs(float(limiter))
+    analyze = _analyzer(engine, rsgain_options, error_logs, target_lufs, max_peak_db, "p", true_peak=True)
+    batcher = ResultBatcher(on_results)
+    supported = [(idx, f) for idx, f in enumerate(files) if Path(f).suffix.lower() in supported_filetypes]
+    #rows that can't be processed at all are reported straight away
+    supported_rows = {idx for idx, _ in supported}
+    batcher.extend([(idx, "-", "-", "-") for idx in range(len(files)) if idx not in supported_rows])
+    #files finished before an interruption were already changed, they must not get the gain twice
+    supported = _resume_from_journal(supported, files, journal, batcher)
+    analyze = _share_duplicates(analyze, [f for _, f in supported], jobs)
+    #stream info from the headers picks encoder settings and weights progress by duration
+    with trace.span("probe", files=len(supported)):
+        infos = probe_files([f for _, f in supported], jobs)
+    weights = duration_weights([f for _, f in supported], infos)
+    #longest files first so a long track doesn't start last and hold up the end of the run
+    supported.sort(key=lambda item: weights[item[1]], reverse=True)
+    #measuring and encoding each count once per file
+    steps = max(1e-9, sum(weights.values()) * 2)
+    processed = 0
+
+    def measure_batch(batch):
+        #measure a batch of (idx, path) items with one rsgain call (or in-process)
+        #returns (errors, [(idx, path, (loudness, gain_db, peak))]) so measured files go straight on to encoding
+        measured = []
+        errors = []
+        pending = []
+        for idx, file_path in batch:
+            known = cache.get_measurement(file_path) if cache is not None else None
+            if known is None:
+                pending.append((idx, file_path))
+                continue
+            #loudness and true peak don't depend on the settings, work out the gain for these ones
+            file_loudness, peak = known
+            gain_db, _ = compute_track_gain(file_loudness, peak, target_lufs, max_peak_db)
+            measured.append((idx, file_path, (file_loudness, gain_db, peak)))
+        with trace.span("analyze", files=len(pending)):
+            results, failures = analyze([file_path for _, file_path in pending])
+        for idx, file_path in pending:
+            if file_path not in results:
+                errors.append(f"{file_path} (analyze):\n{failures.get(file_path, '')}")
+                continue
+            loudness_val, gain_val, _, peak = results[file_path]
+            if gain_val is None or gain_val == "-":
+                errors.append(f"{file_path}: Could not determine ReplayGain value.")
+                continue
+            try:
+                gain_db = float(gain_val)
+                loudness = float(loudness_val.split()[0])
+            except Exception:
+                errors.append(f"{file_path}: Invalid gain value '{gain_val}'.")
+                continue
+            #keep the source's loudness and true peak so another target or limiter doesn't decode it again
+            if cache is not None and peak is not None:
+                cache.put(file_path, "measure", None, None, results[file_path])
+            measured.append((idx, file_path, (loudness, gain_db, peak)))
+        return errors, measured
+
+    def post_gain_result(idx, measurement):
+        #derive the output file's table values from the single measurement instead of decoding it again
+        loudness, gain_db, peak = measurement
+        new_loudness = loudness + gain_db
+        new_peak = peak * 10 ** (gain_db / 20) if peak is not None else None
+        new_gain, clipped = compute_track_gain(new_loudness, new_peak, target_lufs, max_peak_db)
+        clipping_val = ("Yes" if clipped else "No") if new_peak is not None else "-"
+        return (idx, f"{new_loudness:.2f} LUFS", f"{new_gain:.2f}", clipping_val, new_peak), new_gain, new_peak
+
+    def ffprobe_bit_depth(file_path):
+        #fallback for when the headers couldn't be read in-process
+        try:
+            probe = trace.run_process(
+                "ffprobe",
+                ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=bits_per_raw_sample,bits_per_sample", "-of", "default=noprint_wrappers=1:nokey=1", file_path],
+                capture_output=True, text=True, check=False
+            )
+            bit_depths = [int(x) for x in probe.stdout.strip().splitlines() if x.isdigit()]
+            return max(bit_depths) if bit_depths else None
+        except Exception:
+            return None
+
+    def encoder_options(ext, info, file_path):
+        #pick the ffmpeg encoder settings that keep the source's codec and bit depth
+        if ext == ".mp3":
+            return ["-c:a", "libmp3lame"]
+        if ext == ".flac":
+            bit_depth = info.bits_per_sample if info is not None else ffprobe_bit_depth(file_path)
+            options = ["-c:a", "flac"]
+            if bit_depth == 16:
+                options += ["-sample_fmt", "s16"]
+            elif bit_depth in (24, 32):
+                options += ["-sample_fmt", "s32"]
+            return options
+        if ext == ".m4a":
+            if info is not None and info.codec == "alac":
+                options = ["-c:a", "alac"]
+                if info.bits_per_sample == 16:
+                    options += ["-sample_fmt", "s16p"]
+                elif info.bits_per_sample in (24, 32):
+                    options += ["-sample_fmt", "s32p"]
+            else:
+                options = ["-c:a", "aac"]
+                #keep roughly the source bitrate instead of ffmpeg's default
+                if info is not None and info.bitrate:
+                    options += ["-b:a", f"{max(32, round(info.bitrate / 1000))}k"]
+            return options
+        return []
+
+    def apply_mp3_lossless(idx, file_path, out_file, measurement):
+        #change an mp3's gain in 1.5 db global_gain steps without re-encoding, returns (result, errors)
+        #returns None when the stream can't be patched so the caller falls back to ffmpeg
+        loudness, gain_db, peak = measurement
+        steps = mp3gain.gain_to_steps(gain_db, peak, max_peak_db)
+        applied = (loudness, steps * mp3gain.GAIN_STEP_DB, peak)
+        result, new_gain, new_peak = post_gain_result(idx, applied)
+        try:
+            with trace.span("mp3 gain", file=file_path):
+                mp3gain.apply_gain(file_path, steps, out_path=out_file)
+        except (mp3gain.Mp3GainError, ImportError):
+            return None
+        except Exception as e:
+            return (idx, "-", "-", "-"), [f"{file_path} (mp3 gain): {str(e)}"]
+        try:
+            with trace.span("write tags", file=out_file):
+                write_loudness_tags(out_file, new_gain, new_peak, target_lufs, _lufs(result[1]), drop_album=True)
+        except Exception as e:
+            return result, [f"{out_file} (tag): {str(e)}"]
+        return result, []
+
+    def apply_file(item):
+        #re-encode a single file with its measured gain, returns (result, errors)
+        with trace.span("apply file", file=item[1]):
+            return encode_file(item)
+
+    def encode_file(item):
+        idx, file_path, measurement = item
+        ext = Path(file_path).suffix.lower()
+        gain_db = measurement[1]
+        result, new_gain, new_peak = post_gain_result(idx, measurement)
+
+        # Determine output file path
+        out_file = file_path
+        if create_modified and output_dir:
+            p = Path(file_path)
+            out_file = str(output_dir / p.name)
+
+        if ext == ".mp3" and lossless_mp3:
+            lossless = apply_mp3_lossless(idx, file_path, out_file, measurement)
+            if lossless is not None:
+                return lossless
+
+        tmp_file = str(Path(out_file).with_suffix(f".gain_tmp{ext}"))
+        ffmpeg_cmd = [
+            "ffmpeg", "-y", "-i", file_path,
+            "-map_metadata", "0", "-map", "0",
+            "-af", f"volume={gain_db}dB",
+            "-c:v", "copy",
+        ]
+        ffmpeg_cmd += encoder_options(ext, infos.get(file_path), file_path)
+        ffmpeg_cmd.append(tmp_file)
+        failed = (idx, "-", "-", "-")
+        try:
+            #uses text=False to avoid decode errors, decode manually
+            proc_ffmpeg = trace.run_process("ffmpeg", ffmpeg_cmd, capture_output=True, text=False, check=False)
+            if proc_ffmpeg.returncode != 0:
+                stderr = safe_decode(proc_ffmpeg.stderr) if proc_ffmpeg.stderr else ""
+                stdout = safe_decode(proc_ffmpeg.stdout) if proc_ffmpeg.stdout else ""
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                return failed, [f"{file_path} (ffmpeg):\n{stderr or stdout}"]
+            #the copied tags still hold the source's values (a stale reference loudness included), they are
+            #replaced with mutagen like tag_files does, before the replace so the output never shows up without them
+            try:
+                with trace.span("write tags", file=out_file):
+                    write_loudness_tags(tmp_file, new_gain, new_peak, target_lufs, _lufs(result[1]), drop_album=True)
+            except Exception as e:
+                os.remove(tmp_file)
+                return failed, [f"{out_file} (tag): {e}"]
+            with trace.span("replace", file=out_file):
+                os.replace(tmp_file, out_file)
+        except Exception as e:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return failed, [f"{file_path} (ffmpeg): {str(e)}"]
+        return result, []
+
+    #analysis of upcoming batches runs alongside encoding of files already measured
+    encode_jobs = jobs
+    analysis_jobs = analysis_jobs or max(1, (encode_jobs or default_jobs()) // 2)
+    progress = ProgressReporter(on_progress)
+    batches = make_batches(supported, batch_size, lambda item: item[1])
+    device_paths = (_batch_paths, lambda work: [work[1]]) if per_device else (None, None)
+    for stage, item, stage_result in run_pipeline(batches, measure_batch, apply_file, analysis_jobs, encode_jobs,
+                                                  paths1=device_paths[0], paths2=device_paths[1]):
+        if stage == 1:
+            errors, measured = stage_result
+            measured_paths = {m[1] for m in measured}
+            #files that couldn't be measured still count as encoded for progress
+            processed += sum(weights[f] * (1 if f in measured_paths else 2) for _, f in item)
+            batcher.extend([(idx, "-", "-", "-") for idx, f in item if f not in measured_paths])
+        else:
+            result, errors = stage_result
+            batcher.add(result)
+            _record_results(journal, files, [result])
+            processed += weights[item[1]]
+        error_logs.extend(errors)
+        progress.update(processed, steps)
+    if cache is not None:
+        cache.flush()
+    batcher.flush()
+    return error_logs
@@ -0,0 +1,212 @@
+#append-only journal of long running jobs so an interrupted run can be resumed
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from .utils import get_cache_dir
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+#sync to disk after this many records or seconds, whichever comes first
+SYNC_RECORDS = 256
+SYNC_INTERVAL = 2.0
+#journals without a readable header are only removed once they are this old (seconds),
+#a younger one may belong to another instance that has only just created it
+STALE_AGE = 3600
+
+#an unfinished job read back from disk: kind ("tag"/"apply"), its settings and files,
+#and {file: (loudness, replaygain, clipping)} for the files that were already done
+JournalState = namedtuple("JournalState", "path kind settings files done")
+
+def get_journal_dir():
+    return os.path.join(get_cache_dir(), "journals")
+
+class JournalLockedError(OSError):
+    #raised when another running instance already has the journal open
+    pass
+
+def _try_lock(f):
+    #take an exclusive lock on an open journal without waiting, False if another process holds it
+    #the lock goes away when the file is closed or the process exits, even after a crash
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+def is_locked(path):
+    #whether a running instance (this one included) has the journal at path open
+    try:
+        with open(path, "rb") as f:
+            return not _try_lock(f)
+    except OSError:
+        return True
+
+class JobJournal:
+    """
+    Journal of one job, one json object per line. The first line holds the job's kind,
+    settings and file list, then a line is appended for every file that finishes. Lines are
+    buffered and fsync'ed in batches (every SYNC_RECORDS lines or SYNC_INTERVAL seconds),
+    so a crash loses at most the last batch, which just means those files are done again.
+    A torn last line is ignored when reading. finish() deletes the journal once the job
+    completes; anything left in the journal directory is an interrupted job.
+    The journal is locked while open, so another instance never resumes or removes a job
+    that is still running; JournalLockedError is raised if someone else already holds it.
+    """
+
+    def __init__(self, path, mode="a"):
+        self.path = path
+        self._file = open(path, mode, encoding="utf-8")
+        if not _try_lock(self._file):
+            self._file.close()
+            raise JournalLockedError(f"{path} is in use by another instance")
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._timer = None  #pending sync for records that arrived since the last one
+        self.done = {}  #results already recorded, filled in by resume()
+
+    @classmethod
+    def create(cls, kind, files, settings, directory=None):
+        #start a journal for a new job, the header is synced right away
+        directory = directory or get_journal_dir()
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha1("\n".join(files).encode("utf-8", errors="surrogatepass")).hexdigest()[:12]
+        path = os.path.join(directory, f"{kind}-{int(time.time())}-{digest}.jsonl")
+        journal = cls(path, "x")
+        header = {"type": "job", "kind": kind, "settings": settings, "files": list(files), "started": time.time()}
+        with journal._lock:
+            journal._file.write(json.dumps(header) + "\n")
+            journal._sync()
+        return journal
+
+    @classmethod
+    def resume(cls, state):
+        #reopen an unfinished job's journal to carry on appending to it
+        journal = cls(state.path, "a")
+        journal.done = dict(state.done)
+        return journal
+
+    def record(self, entries):
+        #append (file, (loudness, replaygain, clipping)) entries for finished files
+        with self._lock:
+            if self._file is None:
+                return
+            for file_path, result in entries:
+                self._file.write(json.dumps({"type": "done", "file": file_path, "result": list(result)}) + "\n")
+                self._unsynced += 1
+            if self._unsynced >= SYNC_RECORDS or time.monotonic() - self._last_sync >= SYNC_INTERVAL:
+                self._sync()
+            elif self._timer is None:
+                #no guarantee another record comes along, so sync these within SYNC_INTERVAL regardless
+                self._timer = threading.Timer(SYNC_INTERVAL, self._sync_later)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync_later(self):
+        #timer thread
+        with self._lock:
+            self._timer = None
+            if self._file is not None and self._unsynced:
+                self._sync()
+
+    def _sync(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        #sync and close, the journal stays on disk so the job can be resumed later
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def finish(self):
+        #the job completed, nothing to resume
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        _remove(self.path)
+
+def read_journal(path):
+    #read a journal back, returns a JournalState or None if it has no valid header
+    kind = None
+    settings = {}
+    files = []
+    done = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    #torn write from a crash, everything before it is still good
+                    continue
+                if entry.get("type") == "job" and kind is None:
+                    kind = entry.get("kind")
+                    settings = entry.get("settings") or {}
+                    files = entry.get("files") or []
+                elif entry.get("type") == "done" and kind is not None:
+                    done[entry["file"]] = tuple(entry["result"])
+    except OSError:
+        return None
+    if kind is None:
+        return None
+    return JournalState(path, kind, settings, files, done)
+
+def find_unfinished(directory=None):
+    #return JournalStates of interrupted jobs, newest first
+    #journals another instance has open are skipped, ones without a header are removed once stale
+    directory = directory or get_journal_dir()
+    try:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")]
+    except OSError:
+        return []
+    paths.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0, reverse=True)
+    states = []
+    for path in paths:
+        if is_locked(path):
+            continue
+        state = read_journal(path)
+        if state is not None:
+            states.append(state)
+        elif _is_stale(path):
+            discard(path)
+    return states
+
+def _is_stale(path):
+    try:
+        return time.time() - os.path.getmtime(path) > STALE_AGE
+    except OSError:
+        return False
+
+def discard(path):
+    #remove an unfinished job's journal, left alone if another instance has it open
+    if not is_locked(path):
+        _remove(path)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
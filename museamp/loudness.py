@@ -0,0 +1,199 @@
+#in-process ebu r128 loudness measurement, an optional alternative to running rsgain
+#audio is decoded by ffmpeg to raw float pcm on a pipe and measured with numpy/scipy in blocks
+import math
+import subprocess
+from .probe import probe_file
+from .truepeak import TruePeakMeter
+from .utils import compute_track_gain
+
+try:
+    import numpy as np
+    from scipy.signal import lfilter
+except ImportError:
+    np = None
+    lfilter = None
+
+#frames read from the decoder per chunk, keeps memory flat no matter how long the file is
+CHUNK_FRAMES = 1 << 16
+#gates from itu-r bs.1770-4: -70 lufs absolute, -10 lu below the ungated mean
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+class LoudnessError(Exception):
+    #raised when a file can't be decoded or measured
+    pass
+
+def available():
+    #the native engine needs numpy and scipy, rsgain is used otherwise
+    return np is not None and lfilter is not None
+
+def k_weighting(rate):
+    #k-weighting filter (high shelf + high pass) for any sample rate, from the analog
+    #prototypes libebur128 uses, returned as one combined (b, a) biquad cascade
+    f0 = 1681.974450955533
+    gain = 3.999843853973347
+    q = 0.7071752369554196
+    k = math.tan(math.pi * f0 / rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+    k = math.tan(math.pi * f0 / rate)
+    a0 = 1 + k / q + k * k
+    pass_b = [1.0, -2.0, 1.0]
+    pass_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.convolve(shelf_b, pass_b), np.convolve(shelf_a, pass_a)
+
+def channel_weights(channels):
+    #bs.1770 weights for libebur128's default channel map: surrounds count 1.41x,
+    #lfe and anything past 5.1 are left out
+    if channels <= 3:
+        weights = [1.0] * channels
+    elif channels == 4:
+        weights = [1.0, 1.0, 1.41, 1.41]
+    elif channels == 5:
+        weights = [1.0, 1.0, 1.0, 1.41, 1.41]
+    else:
+        weights = [1.0, 1.0, 1.0, 0.0, 1.41, 1.41] + [0.0] * (channels - 6)
+    return np.array(weights)
+
+class LoudnessMeter:
+    """
+    Streaming integrated loudness and peak meter. Feed it float frames with add()
+    (shape (frames, channels)) in any chunk size; only the energy of each 100 ms
+    sub-block is kept, so memory grows by a few bytes per second of audio. The 400 ms
+    gating blocks (75% overlap) are built from those sub-blocks when integrated() is called.
+    peak is the sample peak, or the oversampled true peak when true_peak is set.
+    """
+
+    def __init__(self, rate, channels, true_peak=False):
+        if not available():
+            raise LoudnessError("numpy and scipy are required for the native loudness engine")
+        self.rate = rate
+        self.channels = channels
+        self.b, self.a = k_weighting(rate)
+        self.zi = np.zeros((len(self.a) - 1, channels))
+        self.weights = channel_weights(channels)
+        self.sub_len = (rate + 5) // 10   #samples per 100 ms, rounded like libebur128
+        self.partial = np.zeros(channels)
+        self.partial_len = 0
+        self.sub_energies = []  #arrays of (sub-blocks, channels) sums of squares
+        self.sample_peak = 0.0
+        self.true_peak = TruePeakMeter(rate, channels) if true_peak else None
+
+    @property
+    def peak(self):
+        return self.true_peak.peak if self.true_peak is not None else self.sample_peak
+
+    def add(self, frames):
+        frames = np.asarray(frames, dtype=np.float64).reshape(-1, self.channels)
+        if not len(frames):
+            return
+        if self.true_peak is not None:
+            self.true_peak.add(frames)
+        else:
+            self.sample_peak = max(self.sample_peak, float(np.abs(frames).max()))
+        filtered, self.zi = lfilter(self.b, self.a, frames, axis=0, zi=self.zi)
+        squares = filtered * filtered
+        pos = 0
+        #finish the sub-block left over from the previous chunk
+        if self.partial_len:
+            take = min(self.sub_len - self.partial_len, len(squares))
+            self.partial += squares[:take].sum(axis=0)
+            self.partial_len += take
+            pos = take
+            if self.partial_len < self.sub_len:
+                return
+            self.sub_energies.append(self.partial[np.newaxis, :])
+            self.partial = np.zeros(self.channels)
+            self.partial_len = 0
+        #whole sub-blocks in one reshape, the remainder starts the next one
+        count = (len(squares) - pos) // self.sub_len
+        if count:
+            end = pos + count * self.sub_len
+            self.sub_energies.append(squares[pos:end].reshape(count, self.sub_len, self.channels).sum(axis=1))
+            pos = end
+        if pos < len(squares):
+            self.partial = squares[pos:].sum(axis=0)
+            self.partial_len = len(squares) - pos
+
+    def block_energies(self):
+        #weighted mean square of every 400 ms block
+        if not self.sub_energies:
+            return np.zeros(0)
+        subs = np.concatenate(self.sub_energies)
+        if len(subs) < 4:
+            return np.zeros(0)
+        blocks = (subs[:-3] + subs[1:-2] + subs[2:-1] + subs[3:]) / (4 * self.sub_len)
+        return blocks @ self.weights
+
+    def integrated(self):
+        #gated integrated loudness in lufs, None if the audio is shorter than one block or silent
+        energies = self.block_energies()
+        energies = energies[energies >= 10 ** ((ABSOLUTE_GATE + 0.691) / 10)]
+        if not len(energies):
+            return None
+        threshold = energies.mean() * 10 ** (RELATIVE_GATE / 10)
+        gated = energies[energies >= threshold]
+        return -0.691 + 10 * math.log10(gated.mean())
+
+def _decode_command(path, info, ffmpeg="ffmpeg"):
+    #first audio stream as interleaved 32-bit float at its own rate and channel count
+    return [
+        ffmpeg, "-nostdin", "-v", "error", "-i", path,
+        "-map", "0:a:0", "-ac", str(info.channels), "-ar", str(info.sample_rate),
+        "-f", "f32le", "-acodec", "pcm_f32le", "-",
+    ]
+
+def measure_file(path, true_peak=False, ffmpeg="ffmpeg"):
+    #decode path and return (integrated_loudness, peak), raises LoudnessError
+    if not available():
+        raise LoudnessError("numpy and scipy are required for the native loudness engine")
+    info = probe_file(path)
+    if info is None or not info.sample_rate or not info.channels:
+        raise LoudnessError("could not read the stream format")
+    meter = LoudnessMeter(info.sample_rate, info.channels, true_peak)
+    frame_bytes = 4 * info.channels
+    try:
+        proc = subprocess.Popen(_decode_command(path, info, ffmpeg), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise LoudnessError(str(e))
+    with proc:
+        leftover = b""
+        while True:
+            data = proc.stdout.read(CHUNK_FRAMES * frame_bytes)
+            if not data:
+                break
+            data = leftover + data
+            usable = len(data) - len(data) % frame_bytes
+            leftover = data[usable:]
+            meter.add(np.frombuffer(data[:usable], dtype="<f4"))
+        stderr = proc.stderr.read()
+    if proc.returncode != 0:
+        raise LoudnessError(stderr.decode("utf-8", errors="replace") or f"ffmpeg exited with {proc.returncode}")
+    loudness = meter.integrated()
+    if loudness is None:
+        raise LoudnessError("no audio above the gate (silent or too short)")
+    return loudness, meter.peak
+
+def run_native(paths, target_lufs=-18.0, max_peak_db=0.0, clip_mode="n", true_peak=False):
+    """
+    Measure files in-process. Returns (results, errors) in the same shape as run_rsgain:
+    results maps path -> (loudness, replaygain, clipping, peak) with the same formatting
+    as rsgain's output, errors maps path -> error text. The defaults match rsgain custom,
+    true_peak matches its -t option.
+    """
+    results = {}
+    errors = {}
+    for path in paths:
+        try:
+            loudness, peak = measure_file(path, true_peak)
+        except LoudnessError as e:
+            errors[path] = f"Error: {e}"
+            continue
+        gain, clipped = compute_track_gain(loudness, peak, target_lufs, max_peak_db, clip_mode)
+        results[path] = (f"{loudness:.2f} LUFS", f"{gain:.2f}", "Yes" if clipped else "No", peak)
+    return results, errors
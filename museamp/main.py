@@ -1,6 +1,4 @@
 import sys
-from PySide6.QtWidgets import QApplication
-from .gui import AudioToolGUI
 from .utils import (
     get_supported_filetypes,
     is_supported_filetype,
@@ -11,6 +9,9 @@ from .utils import (
 )
 
 def main():
+    #qt is imported here so importing this module (or the cli) doesn't load PySide6
+    from PySide6.QtWidgets import QApplication
+    from .gui import AudioToolGUI
     #create the qt application
     app = QApplication(sys.argv)
     #create and show the main window
@@ -0,0 +1,201 @@
+#track list model for the main table, stored by column instead of one item object per cell
+import os
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from . import trace
+from .utils import compute_track_gain
+
+#placeholder shown until a file has been analyzed
+EMPTY = "-"
+
+HEADERS = ["File Path", "Extension", "File Loudness", "ReplayGain", "Clipping"]
+
+def _measurement(loudness_val, peak):
+    #(loudness, peak) from a result row, None unless both are known
+    if peak is None:
+        return None
+    try:
+        return float(str(loudness_val).split()[0]), float(peak)
+    except (ValueError, IndexError):
+        return None
+
+def normalize_path(path):
+    #key used to spot the same file added twice
+    return os.path.normcase(os.path.normpath(str(path)))
+
+class TrackTableModel(QAbstractTableModel):
+    """
+    Read-only table of tracks backed by one python list per column and a dict from
+    normalized path to row, so lookups and duplicate checks are O(1) no matter how
+    many rows there are. The view only asks for the rows that are on screen.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._paths = []
+        self._loudness = []
+        self._gain = []
+        self._clipping = []
+        self._measured = []  #(loudness lufs, linear true peak) per row, None until it is known
+        self._index = {}    #normalized path -> row
+        self._thumbnails = None  #ThumbnailService drawing cover art in the first column, if any
+
+    #qt model interface
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._paths)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        if role == Qt.DecorationRole:
+            #only asked for rows on screen, so only those get their art loaded
+            if column == 0 and self._thumbnails is not None:
+                return self._thumbnails.thumbnail(self._paths[row])
+            return None
+        if role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        if column == 0:
+            return self._paths[row]
+        if role == Qt.ToolTipRole:
+            return None
+        if column == 1:
+            return os.path.splitext(self._paths[row])[1].lower()
+        if column == 2:
+            return self._loudness[row]
+        if column == 3:
+            return self._gain[row]
+        if column == 4:
+            return self._clipping[row]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and 0 <= section < len(HEADERS):
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    #track list helpers used by the gui
+    def set_thumbnails(self, service):
+        #show cover art from a ThumbnailService next to each path
+        self._thumbnails = service
+        service.ready.connect(self._thumbnail_ready)
+
+    def _thumbnail_ready(self, path):
+        row = self.row(path)
+        if row is not None:
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def contains(self, path):
+        return normalize_path(path) in self._index
+
+    def row(self, path):
+        #row of path, or None if it isn't listed
+        return self._index.get(normalize_path(path))
+
+    def path(self, row):
+        return self._paths[row]
+
+    def file_paths(self):
+        return list(self._paths)
+
+    def add_files(self, paths):
+        #append paths that aren't listed yet, returns (first_new_row, added_paths)
+        start = len(self._paths)
+        added = []
+        seen = {}
+        for path in paths:
+            path = str(path)
+            key = normalize_path(path)
+            if key in self._index or key in seen:
+                continue
+            seen[key] = start + len(added)
+            added.append(path)
+        if added:
+            with trace.span("table insert", "gui", rows=len(added)):
+                self.beginInsertRows(QModelIndex(), start, start + len(added) - 1)
+                self._paths.extend(added)
+                self._loudness.extend([EMPTY] * len(added))
+                self._gain.extend([EMPTY] * len(added))
+                self._clipping.extend([EMPTY] * len(added))
+                self._measured.extend([None] * len(added))
+                self._index.update(seen)
+                self.endInsertRows()
+        return start, added
+
+    def remove_rows(self, rows):
+        #remove the given rows, one model notification per contiguous range
+        rows = sorted(set(rows), reverse=True)
+        if not rows:
+            return
+        ranges = []
+        first = last = rows[0]
+        for row in rows[1:]:
+            if row == first - 1:
+                first = row
+            else:
+                ranges.append((first, last))
+                first = last = row
+        ranges.append((first, last))
+        for first, last in ranges:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._paths[first:last + 1]
+            del self._loudness[first:last + 1]
+            del self._gain[first:last + 1]
+            del self._clipping[first:last + 1]
+            del self._measured[first:last + 1]
+            self.endRemoveRows()
+        self._index = {normalize_path(p): row for row, p in enumerate(self._paths)}
+
+    def set_results(self, updates):
+        #apply (row, loudness, replaygain, clipping[, peak]) updates with a single repaint of the changed span
+        #rows that come with a true peak keep their measurement so they can be re-targeted later
+        first = None
+        last = None
+        count = len(self._paths)
+        for row, loudness_val, replaygain_val, clipping_val, *peak in updates:
+            if not 0 <= row < count:
+                continue
+            self._loudness[row] = loudness_val
+            self._gain[row] = replaygain_val
+            self._clipping[row] = clipping_val
+            self._measured[row] = _measurement(loudness_val, peak[0] if peak else None)
+            first = row if first is None else min(first, row)
+            last = row if last is None else max(last, row)
+        if first is not None:
+            with trace.span("table update", "gui", rows=len(updates)):
+                self.dataChanged.emit(self.index(first, 2), self.index(last, 4))
+
+    def clear_results(self, columns=(2, 3, 4)):
+        #reset result columns to the placeholder before a new run
+        if not self._paths:
+            return
+        for column in columns:
+            values = {2: self._loudness, 3: self._gain, 4: self._clipping}[column]
+            values[:] = [EMPTY] * len(values)
+        if 2 in columns:
+            self._measured[:] = [None] * len(self._measured)
+        self.dataChanged.emit(self.index(0, min(columns)), self.index(len(self._paths) - 1, max(columns)))
+
+    def retarget(self, target_lufs, max_peak_db=0.0):
+        #recompute replaygain and clipping of every measured row for another target and limiter,
+        #without decoding anything, returns the number of rows changed
+        first = None
+        last = None
+        changed = 0
+        for row, measured in enumerate(self._measured):
+            if measured is None:
+                continue
+            changed += 1
+            gain, clipped = compute_track_gain(measured[0], measured[1], target_lufs, max_peak_db, "p")
+            self._gain[row] = f"{gain:.2f}"
+            self._clipping[row] = "Yes" if clipped else "No"
+            first = row if first is None else first
+            last = row
+        if first is not None:
+            with trace.span("table retarget", "gui", rows=changed):
+                self.dataChanged.emit(self.index(first, 3), self.index(last, 4))
+        return changed
@@ -0,0 +1,299 @@
+#lossless mp3 gain changes by rewriting each granule's global_gain field (the way mp3gain does)
+import mmap
+import os
+import shutil
+from .staging import stage_copy
+
+#each global_gain step changes the decoded level by 1.5 db
+GAIN_STEP_DB = 1.5
+
+#bitrates in kbps by [mpeg1?][bitrate index] for layer iii
+_BITRATES = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+#sample rates by [version bits][sample rate index]
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),   #mpeg 1
+    2: (22050, 24000, 16000),   #mpeg 2
+    0: (11025, 12000, 8000),    #mpeg 2.5
+}
+
+class Mp3GainError(Exception):
+    #raised when a file can't be gain-adjusted without re-encoding
+    pass
+
+def _parse_header(data, pos):
+    #parse a layer iii frame header at pos
+    #returns (frame_length, side_info_offset, gain_bit_offsets, side_info_len, crc_protected) or None
+    if pos + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    protected = not (b1 & 0x01)
+    bitrate_idx = (b2 >> 4) & 0x0F
+    rate_idx = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+    mode = (b3 >> 6) & 0x03
+    #reserved version, not layer iii, free format/bad bitrate or reserved sample rate
+    if version == 1 or layer != 1 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1][bitrate_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_idx]
+    frame_length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+    channels = 1 if mode == 3 else 2
+    if mpeg1:
+        side_info_len = 17 if channels == 1 else 32
+        start = 9 + (5 if channels == 1 else 3) + 4 * channels
+        offsets = [start + (gr * channels + ch) * 59 + 21 for gr in range(2) for ch in range(channels)]
+    else:
+        side_info_len = 9 if channels == 1 else 17
+        start = 8 + (1 if channels == 1 else 2)
+        offsets = [start + ch * 63 + 21 for ch in range(channels)]
+    side_info = pos + 4 + (2 if protected else 0)
+    if side_info + side_info_len > len(data) or frame_length < side_info - pos + side_info_len:
+        return None
+    return frame_length, side_info, offsets, side_info_len, protected
+
+def _read_bits(data, byte_offset, bit_offset, count):
+    #read count bits starting bit_offset bits into data[byte_offset:]
+    value = 0
+    for i in range(count):
+        bit = bit_offset + i
+        value = (value << 1) | ((data[byte_offset + bit // 8] >> (7 - bit % 8)) & 1)
+    return value
+
+def _write_bits(data, byte_offset, bit_offset, count, value):
+    for i in range(count):
+        bit = bit_offset + i
+        idx = byte_offset + bit // 8
+        mask = 1 << (7 - bit % 8)
+        if (value >> (count - 1 - i)) & 1:
+            data[idx] |= mask
+        else:
+            data[idx] &= ~mask & 0xFF
+
+def _crc16(data, start, end, crc=0xFFFF):
+    #crc-16 (polynomial 0x8005) as used by mpeg audio error protection
+    for idx in range(start, end):
+        byte = data[idx]
+        for bit in range(7, -1, -1):
+            top = (crc >> 15) & 1
+            crc = (crc << 1) & 0xFFFF
+            if top ^ ((byte >> bit) & 1):
+                crc ^= 0x8005
+    return crc
+
+def _audio_bounds(data):
+    #return (start, end) of the mpeg frame data, skipping id3v2 at the front and id3v1/apev2 at the back
+    start = 0
+    size = len(data)
+    while size - start >= 10 and data[start:start + 3] == b"ID3":
+        flags = data[start + 5]
+        tag_size = 0
+        for b in data[start + 6:start + 10]:
+            tag_size = (tag_size << 7) | (b & 0x7F)
+        start += 10 + tag_size + (10 if flags & 0x10 else 0)
+    end = size
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    if end - start >= 32 and data[end - 32:end - 24] == b"APETAGEX":
+        ape_size = int.from_bytes(data[end - 20:end - 16], "little")
+        ape_flags = int.from_bytes(data[end - 12:end - 8], "little")
+        end -= ape_size + (32 if ape_flags & 0x80000000 else 0)
+    return start, max(start, end)
+
+def _is_info_frame(data, pos, frame_length, side_info, side_info_len):
+    #xing/info/vbri frames carry stream info instead of audio and must be left untouched
+    body = data[side_info + side_info_len:pos + frame_length]
+    return body[:4] in (b"Xing", b"Info") or data[pos + 36:pos + 40] == b"VBRI"
+
+def _find_sync(data, pos, end):
+    #find the next position with two consecutive valid frame headers
+    while pos < end - 4:
+        pos = data.find(b"\xff", pos, end)
+        if pos == -1:
+            return -1
+        header = _parse_header(data, pos)
+        if header is not None:
+            next_pos = pos + header[0]
+            if next_pos >= end or _parse_header(data, next_pos) is not None:
+                return pos
+        pos += 1
+    return -1
+
+def _change_gain(data, steps):
+    #add steps to every global_gain in data (a writable buffer), returns (frames, clamped, min_gain, max_gain)
+    start, end = _audio_bounds(data)
+    pos = _find_sync(data, start, end)
+    frames = 0
+    clamped = False
+    min_gain = 255
+    max_gain = 0
+    first = True
+    while pos != -1 and pos < end:
+        header = _parse_header(data, pos)
+        if header is None or pos + header[0] > end:
+            #lost sync (junk between frames or a truncated last frame), look for the next frame
+            pos = _find_sync(data, pos + 1, end)
+            continue
+        frame_length, side_info, offsets, side_info_len, protected = header
+        if first and _is_info_frame(data, pos, frame_length, side_info, side_info_len):
+            first = False
+            pos += frame_length
+            continue
+        first = False
+        for bit_offset in offsets:
+            gain = _read_bits(data, side_info, bit_offset, 8)
+            min_gain = min(min_gain, gain)
+            max_gain = max(max_gain, gain)
+            new_gain = gain + steps
+            if new_gain < 0 or new_gain > 255:
+                clamped = True
+                new_gain = max(0, min(255, new_gain))
+            if steps:
+                _write_bits(data, side_info, bit_offset, 8, new_gain)
+        if protected and steps:
+            #the crc covers the last two header bytes and the side info
+            crc = _crc16(data, pos + 2, pos + 4)
+            crc = _crc16(data, side_info, side_info + side_info_len, crc)
+            data[pos + 4] = crc >> 8
+            data[pos + 5] = crc & 0xFF
+        frames += 1
+        pos += frame_length
+    if frames == 0:
+        raise Mp3GainError("no mpeg layer iii frames found")
+    return frames, clamped, min_gain, max_gain
+
+def gain_to_steps(gain_db, peak=None, max_peak_db=0.0):
+    #round a gain in db to whole global_gain steps, stepping down if rounding up would push the peak over the limit
+    steps = int(round(gain_db / GAIN_STEP_DB))
+    if peak is not None and peak > 0:
+        max_peak = 10 ** (max_peak_db / 20)
+        while steps > 0 and peak * 10 ** (steps * GAIN_STEP_DB / 20) > max_peak:
+            steps -= 1
+    return steps
+
+def scan_gain_range(path):
+    #return (min_global_gain, max_global_gain) of an mp3 without changing it
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise Mp3GainError("empty file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            _, _, min_gain, max_gain = _change_gain(data, 0)
+    return min_gain, max_gain
+
+def _patch(path, steps):
+    #change the global_gain of every frame of path in place, returns (clamped, min_gain, max_gain)
+    with open(path, "r+b") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise Mp3GainError("empty file")
+        with mmap.mmap(f.fileno(), 0) as data:
+            _, clamped, min_gain, max_gain = _change_gain(data, steps)
+            data.flush()
+    return clamped, min_gain, max_gain
+
+def _staged_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.gain_tmp{ext}"
+
+def apply_gain(path, steps, write_undo=True, out_path=None):
+    """
+    Change an mp3's volume by steps * 1.5 db without decoding or re-encoding it, writing the
+    result to out_path (path itself by default). The file is staged to a temporary copy next
+    to out_path, only the side info bytes of each frame of the copy are rewritten, and the copy
+    then replaces out_path, so an interrupted or failed change never leaves a half patched file.
+    Unless write_undo is False, the accumulated undo information is stored in an APEv2
+    MP3GAIN_UNDO tag in the same format mp3gain uses, so undo_gain (or mp3gain -u) can
+    restore the original. Returns True if some global_gain values had to be clamped.
+    """
+    out_path = out_path or path
+    if not steps:
+        if out_path != path:
+            stage_copy(path, out_path)
+        return False
+    if write_undo:
+        #fail before touching the audio if the undo tag can't be written afterwards
+        import mutagen.apev2  # noqa: F401
+    tmp_path = _staged_path(out_path)
+    stage_copy(path, tmp_path)
+    try:
+        shutil.copymode(path, tmp_path)
+        clamped, min_gain, max_gain = _patch(tmp_path, steps)
+        if write_undo:
+            undo_steps, was_clamped = read_undo(tmp_path)
+            #mp3gain stores the change needed to get back to the original
+            write_undo_tag(tmp_path, undo_steps - steps, clamped or was_clamped,
+                           max(0, min_gain + steps), min(255, max_gain + steps))
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+    return clamped
+
+def read_undo(path):
+    #return (undo_steps, clamped) from the MP3GAIN_UNDO tag, (0, False) if there is none
+    try:
+        from mutagen.apev2 import APEv2, APENoHeaderError
+    except ImportError:
+        return 0, False
+    try:
+        tag = APEv2(path)
+    except APENoHeaderError:
+        return 0, False
+    value = str(tag.get("MP3GAIN_UNDO", ""))
+    parts = value.split(",")
+    if len(parts) < 2:
+        return 0, False
+    try:
+        return int(parts[0]), len(parts) > 2 and parts[2].strip().upper() == "W"
+    except ValueError:
+        return 0, False
+
+def write_undo_tag(path, undo_steps, clamped=False, min_gain=None, max_gain=None):
+    #store undo information as an APEv2 tag, removing it once there is nothing left to undo
+    from mutagen.apev2 import APEv2, APENoHeaderError
+    try:
+        tag = APEv2(path)
+    except APENoHeaderError:
+        tag = APEv2()
+    if undo_steps == 0:
+        tag.pop("MP3GAIN_UNDO", None)
+        tag.pop("MP3GAIN_MINMAX", None)
+    else:
+        tag["MP3GAIN_UNDO"] = f"{undo_steps:+04d},{undo_steps:+04d},{'W' if clamped else 'N'}"
+        if min_gain is not None and max_gain is not None:
+            tag["MP3GAIN_MINMAX"] = f"{min_gain:03d},{max_gain:03d}"
+    if len(tag):
+        tag.save(path)
+    else:
+        try:
+            APEv2(path).delete(path)
+        except APENoHeaderError:
+            pass
+
+def undo_gain(path):
+    #revert every gain change recorded in the MP3GAIN_UNDO tag, returns the number of steps undone
+    undo_steps, _ = read_undo(path)
+    if undo_steps:
+        tmp_path = _staged_path(path)
+        stage_copy(path, tmp_path)
+        try:
+            shutil.copymode(path, tmp_path)
+            _patch(tmp_path, undo_steps)
+            write_undo_tag(tmp_path, 0)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _discard(tmp_path)
+            raise
+    return undo_steps
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,281 @@
+#bounded parallel execution for rsgain/ffmpeg child processes
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .trace import profiled
+
+#a device's limit is only reconsidered after a window of at least this many seconds (and at least
+#max(2, limit) finished items), shorter windows are mostly noise
+ADAPT_WINDOW = 1.0
+#relative throughput change between windows that counts as better or worse rather than noise
+ADAPT_THRESHOLD = 0.05
+
+def default_jobs():
+    #default to one child process per cpu core
+    return os.cpu_count() or 1
+
+class AdaptiveLimit:
+    """
+    Concurrency limit for one storage device, tuned by hill climbing on the bytes per second
+    finished in each window: the limit keeps moving one step the same way while throughput
+    improves, turns around when it drops, and steps down when it stays flat, since concurrency
+    that doesn't help only adds seeking on a spinning disk.
+    """
+
+    def __init__(self, start, maximum):
+        self.maximum = max(1, maximum)
+        self.restart(start)
+
+    def restart(self, start):
+        #start over from start, throughput measured at the old limit says nothing about the new one
+        self.limit = min(self.maximum, max(1, start))
+        self.step = 1   #first move probes upwards
+        self.previous = None    #throughput of the last window
+        self.window_start = None
+        self.window_bytes = 0
+        self.window_items = 0
+
+    def started(self, now):
+        if self.window_start is None:
+            self.window_start = now
+
+    def finished(self, size, now):
+        self.window_bytes += size
+        self.window_items += 1
+        elapsed = now - self.window_start
+        if self.window_items < max(2, self.limit) or elapsed < ADAPT_WINDOW:
+            return
+        throughput = self.window_bytes / elapsed
+        if self.previous:
+            change = throughput / self.previous - 1
+            if change < -ADAPT_THRESHOLD:
+                self.step = -self.step
+            elif change <= ADAPT_THRESHOLD:
+                self.step = -1
+        self.previous = throughput
+        self.limit = min(self.maximum, max(1, self.limit + self.step))
+        self.window_start = now
+        self.window_bytes = 0
+        self.window_items = 0
+
+class DeviceScheduler:
+    """
+    Hands out items to a pool of jobs threads with a separate AdaptiveLimit per storage device
+    (st_dev of the folder holding the item's first file), so an ssd, a usb disk and a network
+    share in one run each settle near the concurrency that suits them while the total stays
+    within jobs. paths_of(item) returns the files an item reads. Devices are served in turn and
+    items of one device keep their order. While everything is on one device the limit is jobs.
+    Only used from the thread driving the pool.
+    """
+
+    def __init__(self, jobs, paths_of):
+        self.jobs = jobs
+        self.paths_of = paths_of
+        self.queues = {}    #device -> deque of items not started yet
+        self.limits = {}    #device -> AdaptiveLimit
+        self.running = {}   #device -> items in flight
+        self.devices = []   #round robin order
+        self.turn = 0
+        self.total = 0
+        self.waiting = 0
+        self._dirs = {}     #folder -> st_dev, one stat per folder
+
+    def _device(self, path):
+        folder = os.path.dirname(os.path.abspath(path))
+        if folder not in self._dirs:
+            try:
+                self._dirs[folder] = os.stat(folder).st_dev
+            except OSError:
+                self._dirs[folder] = None
+        return self._dirs[folder]
+
+    def add(self, items):
+        for item in items:
+            paths = self.paths_of(item)
+            device = self._device(paths[0]) if paths else None
+            if device not in self.queues:
+                self.queues[device] = deque()
+                self.running[device] = 0
+                self.devices.append(device)
+                #jobs is split evenly over all devices seen so far, each finds its own level from there;
+                #the earlier ones start over too, otherwise the first device would keep all of jobs
+                share = self.jobs // len(self.devices)
+                for limit in self.limits.values():
+                    limit.restart(share)
+                self.limits[device] = AdaptiveLimit(share, self.jobs)
+            self.queues[device].append(item)
+            self.waiting += 1
+
+    def next(self):
+        #(device, item) to start now, None if nothing may start until something finishes
+        if self.total >= self.jobs or not self.waiting:
+            return None
+        adaptive = len(self.devices) > 1
+        for _ in range(len(self.devices)):
+            device = self.devices[self.turn % len(self.devices)]
+            self.turn += 1
+            queue = self.queues[device]
+            limit = self.limits[device]
+            if queue and self.running[device] < (limit.limit if adaptive else self.jobs):
+                self.running[device] += 1
+                self.total += 1
+                self.waiting -= 1
+                limit.started(time.perf_counter())
+                return device, queue.popleft()
+        return None
+
+    def wrap(self, func):
+        #func for the pool threads, also returns the bytes the item read so throughput can be measured
+        def sized(item):
+            result = func(item)
+            size = 0
+            for path in self.paths_of(item):
+                try:
+                    size += os.path.getsize(path)
+                except OSError:
+                    pass
+            return result, size
+        return sized
+
+    def done(self, ticket, outcome):
+        #record a finished (device, item) from next() and return func's result
+        device, _ = ticket
+        result, size = outcome
+        self.running[device] -= 1
+        self.total -= 1
+        self.limits[device].finished(size, time.perf_counter())
+        return result
+
+class _Fifo:
+    #DeviceScheduler's interface for runs that aren't grouped by device: one queue, one limit
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.queue = deque()
+        self.total = 0
+
+    @property
+    def waiting(self):
+        return len(self.queue)
+
+    def add(self, items):
+        self.queue.extend(items)
+
+    def next(self):
+        if self.total >= self.jobs or not self.queue:
+            return None
+        self.total += 1
+        return None, self.queue.popleft()
+
+    def wrap(self, func):
+        return func
+
+    def done(self, ticket, result):
+        self.total -= 1
+        return result
+
+def _scheduler(jobs, paths_of):
+    return DeviceScheduler(jobs, paths_of) if paths_of is not None else _Fifo(jobs)
+
+def run_parallel(func, items, jobs=None, paths_of=None):
+    #call func(item) for every item with at most `jobs` calls in flight at once
+    #yields (item, result) pairs in completion order so callers can map results back to rows
+    #threads are enough here since the real work happens in child processes
+    #with paths_of(item) -> [files it reads], items are limited per storage device as well (DeviceScheduler)
+    jobs = max(1, int(jobs or default_jobs()))
+    items = iter(items)
+    func = profiled(func)
+    if jobs == 1:
+        for item in items:
+            yield item, func(item)
+        return
+    if paths_of is not None:
+        #every item is grouped up front so a slow device's backlog can't hide the others' items
+        scheduler = DeviceScheduler(jobs, paths_of)
+        scheduler.add(items)
+        sized = scheduler.wrap(func)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            pending = {}
+            while True:
+                ticket = scheduler.next()
+                while ticket is not None:
+                    pending[pool.submit(sized, ticket[1])] = ticket
+                    ticket = scheduler.next()
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ticket = pending.pop(future)
+                    yield ticket[1], scheduler.done(ticket, future.result())
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = {}
+        #keep the queue bounded so huge libraries don't create one future per file up front
+        for item in items:
+            pending[pool.submit(func, item)] = item
+            if len(pending) >= jobs * 2:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                yield item, future.result()
+            for item in items:
+                pending[pool.submit(func, item)] = item
+                if len(pending) >= jobs * 2:
+                    break
+
+def run_pipeline(items, stage1, stage2, jobs1=None, jobs2=None, queue_size=None, paths1=None, paths2=None):
+    """
+    Run two stages over items so the second overlaps the first instead of waiting for it.
+    stage1(item) returns (result, work) where work is an iterable of inputs for stage2,
+    and stage2(work_item) returns a result. Each stage has its own thread pool and
+    concurrency limit, and at most queue_size stage2 inputs wait between them; stage1
+    stops being fed while that queue is full so it can't run far ahead of stage2.
+    paths1/paths2(item) -> [files it reads] also limit each stage per storage device like run_parallel.
+    Yields (1, item, (result, work)) and (2, work_item, result) events in completion order.
+    """
+    jobs1 = max(1, int(jobs1 or default_jobs()))
+    jobs2 = max(1, int(jobs2 or default_jobs()))
+    queue_size = max(1, int(queue_size or jobs2 * 4))
+    scheduler1 = _scheduler(jobs1, paths1)
+    scheduler2 = _scheduler(jobs2, paths2)
+    stage1 = scheduler1.wrap(profiled(stage1))
+    stage2 = scheduler2.wrap(profiled(stage2))
+    items = iter(items)
+    items_left = True
+    if paths1 is not None:
+        scheduler1.add(items)
+        items_left = False
+    with ThreadPoolExecutor(max_workers=jobs1) as pool1, ThreadPoolExecutor(max_workers=jobs2) as pool2:
+        pending1 = {}
+        pending2 = {}
+        while True:
+            #feed stage2 first, then top stage1 up only while the queue between them has room
+            ticket = scheduler2.next()
+            while ticket is not None:
+                pending2[pool2.submit(stage2, ticket[1])] = ticket
+                ticket = scheduler2.next()
+            while scheduler2.waiting < queue_size:
+                if items_left and not scheduler1.waiting:
+                    try:
+                        scheduler1.add([next(items)])
+                    except StopIteration:
+                        items_left = False
+                ticket = scheduler1.next()
+                if ticket is None:
+                    break
+                pending1[pool1.submit(stage1, ticket[1])] = ticket
+            if not pending1 and not pending2:
+                break
+            done, _ = wait(list(pending1) + list(pending2), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in pending1:
+                    ticket = pending1.pop(future)
+                    result, work = scheduler1.done(ticket, future.result())
+                    work = list(work)
+                    scheduler2.add(work)
+                    yield 1, ticket[1], (result, work)
+                else:
+                    ticket = pending2.pop(future)
+                    yield 2, ticket[1], scheduler2.done(ticket, future.result())
@@ -0,0 +1,76 @@
+#in-process audio stream info from file headers (no ffprobe process per file)
+import os
+import threading
+from collections import namedtuple, OrderedDict
+from .pool import run_parallel
+
+#codec is "flac", "mp3", "alac" or "aac"; fields mutagen can't tell are None
+AudioInfo = namedtuple("AudioInfo", "codec bits_per_sample sample_rate channels duration bitrate")
+
+#probe results keyed on (path, size, mtime_ns) so edited files are probed again
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 50000
+
+def _read_info(path):
+    #read stream info from the container headers with mutagen
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".flac":
+        from mutagen.flac import FLAC
+        info = FLAC(path).info
+        codec = "flac"
+    elif ext == ".mp3":
+        from mutagen.mp3 import MP3
+        info = MP3(path).info
+        codec = "mp3"
+    elif ext == ".m4a":
+        from mutagen.mp4 import MP4
+        info = MP4(path).info
+        codec = "alac" if getattr(info, "codec", "") == "alac" else "aac"
+    else:
+        return None
+    return AudioInfo(
+        codec,
+        getattr(info, "bits_per_sample", None) or None,
+        getattr(info, "sample_rate", None) or None,
+        getattr(info, "channels", None) or None,
+        getattr(info, "length", None),
+        getattr(info, "bitrate", None) or None,
+    )
+
+def probe_file(path):
+    #return an AudioInfo for path, or None if it can't be read (or mutagen isn't installed)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    try:
+        info = _read_info(path)
+    except Exception:
+        info = None
+    with _cache_lock:
+        _cache[key] = info
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return info
+
+def probe_files(paths, jobs=None):
+    #probe many files at once, returns {path: AudioInfo or None}
+    return dict(run_parallel(probe_file, paths, jobs))
+
+def duration_weights(paths, infos, default=None):
+    #return {path: weight} for progress/scheduling, using the duration where known
+    #files without a known duration get the average of the others (or 1.0 if none are known)
+    known = [info.duration for info in infos.values() if info is not None and info.duration]
+    if default is None:
+        default = sum(known) / len(known) if known else 1.0
+    weights = {}
+    for path in paths:
+        info = infos.get(path)
+        weights[path] = info.duration if info is not None and info.duration else default
+    return weights
@@ -0,0 +1,214 @@
+#helpers for running rsgain and parsing its tab separated output
+import os
+import tempfile
+from .trace import run_process
+from .utils import compute_track_gain, get_supported_filetypes
+
+#keep batched command lines well under the windows limit of 32767 characters
+MAX_COMMAND_CHARS = 24000
+#files per rsgain call when batching is turned on
+DEFAULT_BATCH_SIZE = 32
+
+def _parse_values(colmap, values):
+    #turn one rsgain output row into (loudness, replaygain, clipping) strings plus the linear peak
+    loudness_val = "-"
+    replaygain_val = "-"
+    clipping_val = "-"
+    peak = None
+    lufs = values[colmap.get("Loudness (LUFS)", -1)] if "Loudness (LUFS)" in colmap else "-"
+    gain = values[colmap.get("Gain (dB)", -1)] if "Gain (dB)" in colmap else "-"
+    if lufs != "-":
+        loudness_val = f"{lufs} LUFS"
+    if gain != "-":
+        replaygain_val = gain
+    #clipping: check "Clipping" or "Clipping Adjustment?" column from rsgain
+    clip_idx = colmap.get("Clipping", colmap.get("Clipping Adjustment?", -1))
+    if clip_idx != -1:
+        clip_val = values[clip_idx]
+        if clip_val.strip().upper() in ("Y", "YES"):
+            clipping_val = "Yes"
+        elif clip_val.strip().upper() in ("N", "NO"):
+            clipping_val = "No"
+        else:
+            clipping_val = clip_val
+    peak_idx = colmap.get("Peak", -1)
+    if peak_idx != -1 and peak_idx < len(values):
+        try:
+            peak = float(values[peak_idx])
+        except ValueError:
+            peak = None
+    return loudness_val, replaygain_val, clipping_val, peak
+
+def parse_rsgain_rows(output):
+    #parse every data row of rsgain -O output into (filename, values) pairs
+    #filename is None when rsgain didn't print a Filename column
+    lines = output.strip().splitlines()
+    if len(lines) < 2:
+        return []
+    header = lines[0].split('\t')
+    colmap = {k: i for i, k in enumerate(header)}
+    name_idx = colmap.get("Filename", -1)
+    rows = []
+    for line in lines[1:]:
+        values = line.split('\t')
+        if len(values) < len(header):
+            continue
+        filename = values[name_idx] if name_idx != -1 else None
+        rows.append((filename, _parse_values(colmap, values)))
+    return rows
+
+def parse_rsgain_output(output):
+    #turn single file rsgain -O output into (loudness, replaygain, clipping) strings for the table
+    #plus the linear peak value (None if rsgain didn't report one)
+    rows = parse_rsgain_rows(output)
+    if not rows:
+        return "-", "-", "-", None
+    return rows[0][1]
+
+def _match_rows(rows, paths):
+    #map output rows back to the input paths, rsgain prints them in the order it was given
+    results = {}
+    rows = [r for r in rows if r[0] != "Album"]
+    if rows and all(r[0] is None for r in rows):
+        if len(rows) == len(paths):
+            results = {path: values for path, (_, values) in zip(paths, rows)}
+        return results
+    cursor = 0
+    for filename, values in rows:
+        for i in range(cursor, len(paths)):
+            path = paths[i]
+            if filename == path or filename == os.path.basename(path):
+                results[path] = values
+                cursor = i + 1
+                break
+    return results
+
+def run_rsgain(options, paths):
+    """
+    Run rsgain custom with the given options over one or more files.
+    Returns (results, errors) where results maps path -> (loudness, replaygain, clipping, peak)
+    and errors maps path -> error text. Files missing from a batch's output are retried on
+    their own so one bad file doesn't throw away the rest of the batch.
+    """
+    paths = list(paths)
+    if not paths:
+        return {}, {}
+    cmd = ["rsgain", "custom"] + list(options) + ["-O"] + paths
+    try:
+        proc = run_process("rsgain", cmd, capture_output=True, text=True, check=False)
+    except Exception as e:
+        return {}, {path: str(e) for path in paths}
+    if len(paths) == 1:
+        if proc.returncode != 0:
+            return {}, {paths[0]: proc.stderr or proc.stdout}
+        return {paths[0]: parse_rsgain_output(proc.stdout)}, {}
+    results = _match_rows(parse_rsgain_rows(proc.stdout), paths)
+    errors = {}
+    for path in paths:
+        if path not in results:
+            retry_results, retry_errors = run_rsgain(options, [path])
+            results.update(retry_results)
+            errors.update(retry_errors)
+    return results, errors
+
+def make_batches(items, batch_size, path_of=lambda item: item):
+    #split items into lists of at most batch_size, also capping the total command line length
+    batch = []
+    chars = 0
+    for item in items:
+        length = len(path_of(item)) + 1
+        if batch and (len(batch) >= batch_size or chars + length > MAX_COMMAND_CHARS):
+            yield batch
+            batch = []
+            chars = 0
+        batch.append(item)
+        chars += length
+    if batch:
+        yield batch
+
+#per-directory results file written by rsgain easy -O
+EASY_OUTPUT_NAME = "replaygain.csv"
+#target of easy mode's default preset, also rsgain custom's default
+EASY_TARGET_LUFS = -18.0
+
+def _link(src, dst):
+    #symlink, or hardlink where symlinks need privileges (windows); False if neither works
+    for link in (os.symlink, os.link):
+        try:
+            link(src, dst)
+            return True
+        except (OSError, NotImplementedError):
+            continue
+    return False
+
+def _mirror_trees(directories, mirror_root):
+    #link the supported files of each tree into mirror_root, keeping the layout, in one walk
+    #returns {mirror directory: original directory} for the directories that got files
+    supported = get_supported_filetypes()
+    mirrored = {}
+    for i, directory in enumerate(directories):
+        top = os.path.join(mirror_root, str(i))
+        for root, _, filenames in os.walk(directory):
+            names = [n for n in filenames if os.path.splitext(n)[1].lower() in supported]
+            if not names:
+                continue
+            target = os.path.normpath(os.path.join(top, os.path.relpath(root, directory)))
+            os.makedirs(target, exist_ok=True)
+            linked = [name for name in names if _link(os.path.join(root, name), os.path.join(target, name))]
+            if linked:
+                mirrored[target] = root
+    return mirrored
+
+def _as_custom_scan(values):
+    #easy mode's default preset limits positive gains (-c p) while the custom scans used for every
+    #other file don't limit at all (rsgain custom's default -c n); recompute the gain the custom way
+    #so a file gets the same result whichever scanner read it
+    loudness, gain, clipping, peak = values
+    if loudness == "-":
+        return values
+    try:
+        lufs = float(loudness.split()[0])
+    except ValueError:
+        return values
+    gain, clipped = compute_track_gain(lufs, peak, EASY_TARGET_LUFS, 0.0, "n")
+    return loudness, f"{gain:.2f}", "Yes" if clipped else "No", peak
+
+def run_rsgain_easy(directories, threads=None):
+    """
+    Scan whole directory trees with rsgain's easy mode, which analyzes files on its own
+    worker threads. It runs as a dry run so no tags are written. Easy mode leaves a
+    replaygain.csv in every directory it scans, so it is pointed at a temporary mirror of
+    the trees made of links to the audio files instead of the user's folders, which are never
+    written to. Files that couldn't be linked are simply missing from the results.
+    Gains are reported as a custom scan with rsgain's defaults would report them.
+    Returns (results, error) where results maps file path -> (loudness, replaygain, clipping, peak).
+    """
+    results = {}
+    error = None
+    with tempfile.TemporaryDirectory(prefix="museamp-easy-") as mirror_root:
+        try:
+            mirrored = _mirror_trees(directories, mirror_root)
+        except OSError as e:
+            return results, str(e)
+        if not mirrored:
+            return results, error
+        cmd = ["rsgain", "easy", "-q", "-d", "-O"]
+        if threads:
+            cmd += ["-m", str(threads)]
+        cmd += sorted(os.path.join(mirror_root, name) for name in os.listdir(mirror_root))
+        try:
+            proc = run_process("rsgain easy", cmd, capture_output=True, text=True, check=False)
+            if proc.returncode != 0:
+                error = proc.stderr or proc.stdout
+        except Exception as e:
+            error = str(e)
+        for target, root in mirrored.items():
+            try:
+                with open(os.path.join(target, EASY_OUTPUT_NAME), encoding="utf-8", errors="replace") as f:
+                    output = f.read()
+            except OSError:
+                continue
+            for filename, values in parse_rsgain_rows(output):
+                if filename and filename != "Album":
+                    results[os.path.normpath(os.path.join(root, filename))] = _as_custom_scan(values)
+    return results, error
@@ -0,0 +1,99 @@
+#file staging for "create copy" mode without ever holding a whole file in memory
+import errno
+import os
+import sys
+
+#linux ioctl that makes dst share src's extents (btrfs, xfs, bcachefs, ...)
+FICLONE = 0x40049409
+#buffer size for the last resort read/write copy
+CHUNK_SIZE = 1024 * 1024
+
+#errors meaning "this method isn't available here", anything else is a real failure
+_UNSUPPORTED = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY,
+    errno.EBADF, errno.EPERM, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+}
+
+def _reflink(src_fd, dst_fd):
+    import fcntl
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+def _copy_file_range(src_fd, dst_fd, size, offset):
+    #in-kernel copy, also lets nfs 4.2/smb servers copy without the data crossing the network
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+def _sendfile(src_fd, dst_fd, size, offset):
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, min(size - offset, 1 << 30))
+        if sent == 0:
+            break
+        offset += sent
+    return offset
+
+def _chunked(src, dst, offset):
+    #bounded read/write loop, never buffers more than CHUNK_SIZE
+    src.seek(offset)
+    dst.seek(offset)
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = src.readinto(buf)
+        if not n:
+            break
+        dst.write(view[:n])
+
+def stage_copy(src_path, dst_path):
+    """
+    Copy src_path to dst_path using the cheapest method the platform and filesystem offer:
+    a reflink (no data copied at all), then copy_file_range, then sendfile, and finally a
+    bounded chunked copy. Returns the name of the method that finished the copy.
+    A partially written dst_path is removed if the copy fails.
+    """
+    try:
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            src_fd = src.fileno()
+            dst_fd = dst.fileno()
+            size = os.fstat(src_fd).st_size
+            offset = 0
+            if sys.platform.startswith("linux"):
+                try:
+                    _reflink(src_fd, dst_fd)
+                    return "reflink"
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED:
+                        raise
+            if hasattr(os, "copy_file_range"):
+                try:
+                    offset = _copy_file_range(src_fd, dst_fd, size, offset)
+                    if offset >= size:
+                        return "copy_file_range"
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED:
+                        raise
+            if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+                try:
+                    offset = _sendfile(src_fd, dst_fd, size, offset)
+                    if offset >= size:
+                        return "sendfile"
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED:
+                        raise
+            _chunked(src, dst, offset)
+            return "chunked"
+    except BaseException:
+        try:
+            os.remove(dst_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        try:
+            os.chmod(dst_path, os.stat(src_path).st_mode & 0o7777)
+        except OSError:
+            pass
@@ -0,0 +1,209 @@
+#loudness tags read and written in-process with mutagen, so tagged files don't have to be decoded to fill
+#the table and tagging doesn't rewrite whole files
+import os
+from collections import namedtuple
+from .utils import compute_track_gain
+
+#replaygain 2.0 gains are relative to -18 lufs, r128 gains (opus style) to the ebu r128 -23 lufs
+RG_REFERENCE = -18.0
+R128_REFERENCE = -23.0
+#replaygain 1.0 wrote its reference as 89 db spl, which replaygain 2.0 maps to -18 lufs
+SPL_OFFSET = 89.0 - RG_REFERENCE
+
+#the only tags that are looked at, keys are compared case-insensitively
+TAG_KEYS = ("REPLAYGAIN_TRACK_GAIN", "REPLAYGAIN_TRACK_PEAK", "REPLAYGAIN_REFERENCE_LOUDNESS", "R128_TRACK_GAIN",
+            "REPLAYGAIN_ALBUM_GAIN", "REPLAYGAIN_ALBUM_PEAK", "MUSEAMP_TRACK_LOUDNESS")
+#measured loudness, written next to a track gain that a limiter lowered, where reference - gain
+#would come out too loud
+LOUDNESS_KEY = "MUSEAMP_TRACK_LOUDNESS"
+
+#loudness in lufs and linear peak (None when not tagged) worked out from a file's tags,
+#source is "replaygain" or "r128"
+TagLoudness = namedtuple("TagLoudness", "loudness peak source")
+
+def _text(value):
+    #first value of a tag as text, mutagen gives lists of str, bytes (mp4 freeform) or id3 frames
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else ""
+    if hasattr(value, "text"):
+        value = value.text[0] if value.text else ""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    return str(value).strip()
+
+def _number(text):
+    #leading number of values like "-8.50 dB", "0.988831" or "-18.00 LUFS", None if there isn't one
+    try:
+        return float(text.split()[0])
+    except (AttributeError, ValueError, IndexError):
+        return None
+
+def read_tags(path):
+    #return {TAG_KEY: text} for the loudness tags in path, {} if it has none or can't be read
+    ext = os.path.splitext(path)[1].lower()
+    found = {}
+    if ext == ".mp3":
+        from mutagen.id3 import ID3, ID3NoHeaderError
+        try:
+            tags = ID3(path)
+        except ID3NoHeaderError:
+            return found
+        items = ((frame.desc, frame) for frame in tags.getall("TXXX"))
+    elif ext in (".m4a", ".mp4"):
+        from mutagen.mp4 import MP4
+        tags = MP4(path).tags or {}
+        #freeform atoms look like ----:com.apple.iTunes:replaygain_track_gain
+        items = ((key.split(":", 2)[-1], value) for key, value in tags.items() if key.startswith("----:"))
+    elif ext == ".flac":
+        from mutagen.flac import FLAC
+        items = FLAC(path).tags or []
+    else:
+        #ogg vorbis/opus and anything else mutagen knows, all use vorbis comment style keys
+        import mutagen
+        audio = mutagen.File(path)
+        items = audio.tags.items() if audio is not None and audio.tags is not None else []
+    for key, value in items:
+        key = key.upper()
+        if key in TAG_KEYS and key not in found:
+            found[key] = _text(value)
+    return found
+
+def loudness_from_tags(tags):
+    #work out a TagLoudness from read_tags output, None if there is no track gain
+    gain = _number(tags.get("REPLAYGAIN_TRACK_GAIN"))
+    if gain is not None:
+        reference = _number(tags.get("REPLAYGAIN_REFERENCE_LOUDNESS"))
+        if reference is None:
+            reference = RG_REFERENCE
+        elif reference > 0:
+            #"89 dB" style spl reference, lufs references are negative
+            reference -= SPL_OFFSET
+        peak = _number(tags.get("REPLAYGAIN_TRACK_PEAK"))
+        loudness = _number(tags.get(LOUDNESS_KEY))
+        if loudness is None:
+            loudness = reference - gain
+        return TagLoudness(loudness, peak, "replaygain")
+    r128 = tags.get("R128_TRACK_GAIN")
+    if r128:
+        try:
+            #q7.8 fixed point db
+            gain = int(r128) / 256
+        except ValueError:
+            return None
+        return TagLoudness(R128_REFERENCE - gain, None, "r128")
+    return None
+
+def read_loudness(path):
+    #return a TagLoudness for path from its tags, None if it isn't tagged (or mutagen can't read it)
+    try:
+        return loudness_from_tags(read_tags(path))
+    except Exception:
+        return None
+
+def tag_result(path, target_lufs=RG_REFERENCE):
+    #table values from the tags in run_rsgain's result format, (loudness, replaygain, clipping, peak)
+    #with the gain worked out for target_lufs like an rsgain scan would, None if the file isn't tagged
+    known = read_loudness(path)
+    if known is None:
+        return None
+    gain, _ = compute_track_gain(known.loudness, known.peak, target_lufs, 0.0, "n")
+    return f"{known.loudness:.2f} LUFS", f"{gain:.2f}", "No", known.peak
+
+def _padding(info):
+    #keep the file's padding when the new tags fit in it, so only the tag block is rewritten in place;
+    #when they don't, leave mutagen's default amount free so the next change fits
+    return info.padding if info.padding >= 0 else info.get_default_padding()
+
+def loudness_tag_values(path, gain_db, peak=None, target_lufs=RG_REFERENCE, loudness=None, r128=None, drop_album=False):
+    #the tag values to store for a track, {TAG_KEY: text or None to remove it}
+    #loudness is the measured one, stored when the gain was limited and doesn't give it on its own
+    #r128 (default: only for opus files) adds R128_TRACK_GAIN relative to -23 lufs
+    #drop_album removes album gain and peak, which no longer fit once the audio itself was changed
+    values = {
+        "REPLAYGAIN_TRACK_GAIN": f"{gain_db:.2f} dB",
+        "REPLAYGAIN_TRACK_PEAK": f"{peak:.6f}" if peak is not None else None,
+        #readers assume -18 lufs when there's no reference, so it's only written for other targets
+        "REPLAYGAIN_REFERENCE_LOUDNESS": f"{target_lufs:.2f} LUFS" if abs(target_lufs - RG_REFERENCE) > 0.005 else None,
+        LOUDNESS_KEY: None,
+    }
+    #both come rounded to 0.01, an unlimited gain can be off by that much
+    if loudness is not None and abs(target_lufs - loudness - gain_db) > 0.015:
+        values[LOUDNESS_KEY] = f"{loudness:.2f} LUFS"
+    if r128 is None:
+        r128 = os.path.splitext(path)[1].lower() == ".opus"
+    if r128:
+        #the same gain, relative to -23 lufs instead of the target
+        values["R128_TRACK_GAIN"] = str(max(-32768, min(32767, round((R128_REFERENCE - target_lufs + gain_db) * 256))))
+    if drop_album:
+        values["REPLAYGAIN_ALBUM_GAIN"] = None
+        values["REPLAYGAIN_ALBUM_PEAK"] = None
+    return values
+
+def _write_id3(path, values):
+    from mutagen.id3 import ID3, TXXX, ID3NoHeaderError
+    try:
+        tags = ID3(path)
+    except ID3NoHeaderError:
+        tags = ID3()
+    for key, text in values.items():
+        for frame_key in [k for k, frame in tags.items() if isinstance(frame, TXXX) and frame.desc.upper() == key]:
+            del tags[frame_key]
+        if text is not None:
+            tags.add(TXXX(encoding=3, desc=key, text=[text]))
+    #keep id3v2.3 files on 2.3, some players still can't read 2.4
+    version = 3 if tags.version[:2] == (2, 3) else 4
+    if version == 3:
+        tags.update_to_v23()
+    tags.save(path, v2_version=version, padding=_padding)
+
+def _write_mp4(path, values):
+    from mutagen.mp4 import MP4, MP4FreeForm
+    audio = MP4(path)
+    if audio.tags is None:
+        audio.add_tags()
+    for key, text in values.items():
+        for atom in [k for k in audio.tags if k.startswith("----:") and k.split(":", 2)[-1].upper() == key]:
+            del audio.tags[atom]
+        if text is not None:
+            audio.tags[f"----:com.apple.iTunes:{key}"] = [MP4FreeForm(text.encode("utf-8"))]
+    audio.save(padding=_padding)
+
+def _write_vorbis(path, values):
+    import mutagen
+    from mutagen.flac import FLAC
+    audio = FLAC(path) if os.path.splitext(path)[1].lower() == ".flac" else mutagen.File(path)
+    if audio is None:
+        raise ValueError("unsupported file type")
+    if audio.tags is None:
+        audio.add_tags()
+    #vorbis comment keys are case-insensitive, setting or deleting one covers every spelling
+    for key, text in values.items():
+        if text is not None:
+            audio.tags[key] = [text]
+        elif key in audio.tags:
+            del audio.tags[key]
+    audio.save(padding=_padding)
+
+def write_loudness_tags(path, gain_db, peak=None, target_lufs=RG_REFERENCE, loudness=None, r128=None, drop_album=False):
+    """
+    Write a track's ReplayGain tags with mutagen, plus R128_TRACK_GAIN for opus files, files that
+    already have one (so it doesn't go stale) or when r128 is set. When the measured loudness is
+    given and a limiter lowered the gain, it is stored in MUSEAMP_TRACK_LOUDNESS so read_loudness
+    gets it back exactly instead of reference - gain. drop_album removes the album values. Nothing is written if the file already has these values, otherwise the tags are saved
+    into the file's existing padding where they fit so the audio isn't moved. Returns True if the
+    file was written. Raises mutagen's errors (or OSError) if the file can't be read or saved.
+    """
+    current = read_tags(path)
+    if r128 is None and "R128_TRACK_GAIN" in current:
+        r128 = True
+    values = loudness_tag_values(path, gain_db, peak, target_lufs, loudness, r128, drop_album)
+    if all(current.get(key) == text for key, text in values.items()):
+        return False
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".mp3":
+        _write_id3(path, values)
+    elif ext in (".m4a", ".mp4"):
+        _write_mp4(path, values)
+    else:
+        _write_vorbis(path, values)
+    return True
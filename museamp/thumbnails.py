@@ -0,0 +1,252 @@
+#album art thumbnails for the track list, extracted on a background pool only for the rows on screen,
+#downscaled once and kept on disk by image hash with an in-memory lru of pixmaps in front
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from PySide6.QtCore import Qt, QObject, QRunnable, QThreadPool, QBuffer, QByteArray, Signal
+from PySide6.QtGui import QImage, QImageReader, QPixmap
+from .utils import extract_cover_art, get_cache_dir
+
+#longest side of a stored thumbnail in pixels, big enough for hidpi rows
+THUMBNAIL_SIZE = 64
+#bytes of pixmaps kept in memory, the least recently drawn ones are dropped beyond this
+MEMORY_BUDGET = 16 << 20
+#files waiting for a thumbnail, the oldest requests (rows already scrolled past) are dropped beyond this
+MAX_QUEUED = 256
+
+class ThumbnailStore:
+    """
+    Thumbnails on disk, named by the hash of the full-size image so albums that share art share
+    one file, plus an SQLite index from file path to that hash. Files are only parsed again after
+    their size or mtime changes. Safe to use from several threads.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(get_cache_dir(), "thumbnails")
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = 0   #writes since the last commit
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS covers ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def image_path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.png")
+
+    def lookup(self, path, st):
+        #hash of path's cover while the file still matches st, "" if it has none, None if unknown
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, hash FROM covers WHERE path=?", (path,)).fetchone()
+        if row is None or (row[0], row[1]) != (st.st_size, st.st_mtime_ns):
+            return None
+        return row[2]
+
+    def remember(self, path, st, digest):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO covers VALUES (?, ?, ?, ?)",
+                               (path, st.st_size, st.st_mtime_ns, digest))
+            self._pending += 1
+            if self._pending >= 100:
+                self._conn.commit()
+                self._pending = 0
+
+    def save(self, digest, image):
+        #write atomically, another thread may be saving the same art
+        target = self.image_path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}-{threading.get_ident()}.tmp"
+        if image.save(tmp, "PNG"):
+            os.replace(tmp, target)
+
+    def flush(self):
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+def _decode(data, size):
+    #decode image bytes straight to at most size x size, jpegs are scaled while decoding
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    reader = QImageReader(buffer)
+    full = reader.size()
+    if full.isValid() and max(full.width(), full.height()) > size:
+        reader.setScaledSize(full.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if not image.isNull() and max(image.width(), image.height()) > size:
+        #formats that can't scale while decoding
+        image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return image
+
+def load_thumbnail(path, store=None, size=THUMBNAIL_SIZE, have=lambda digest: False):
+    """
+    Return (hash, QImage or None) for the cover art of path, ("", None) if it has none.
+    The file isn't parsed if store already indexed it, and the image is only read from disk
+    when have(hash) is false, so the caller can skip art it already holds.
+    Runs on any thread, QImage doesn't need the gui thread.
+    """
+    path = os.path.abspath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "", None
+    digest = store.lookup(path, st) if store is not None else None
+    if digest == "":
+        return "", None
+    if digest is not None:
+        if have(digest):
+            return digest, None
+        image = QImage(store.image_path(digest))
+        if not image.isNull():
+            return digest, image
+    picture = extract_cover_art(path)
+    if picture is None or not picture.data:
+        if store is not None:
+            store.remember(path, st, "")
+        return "", None
+    digest = hashlib.blake2b(picture.data, digest_size=16).hexdigest()
+    image = None
+    if not have(digest):
+        image = QImage(store.image_path(digest)) if store is not None else QImage()
+        if image.isNull():
+            image = _decode(picture.data, size)
+            if image.isNull():
+                digest = ""
+            elif store is not None:
+                store.save(digest, image)
+    if store is not None:
+        store.remember(path, st, digest)
+    return digest, image if digest else None
+
+class _Loader(QRunnable):
+    #works through the service's queue, newest requests first, until it is empty
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def run(self):
+        service = self.service
+        while True:
+            path = service._next()
+            if path is None:
+                return
+            try:
+                digest, image = load_thumbnail(path, service.store, service.size, service._has)
+            except Exception:
+                digest, image = "", None
+            service._loaded.emit(path, digest, image)
+
+class ThumbnailService(QObject):
+    """
+    Cover art thumbnails for the table. thumbnail(path) returns a QPixmap when it is in memory
+    and otherwise queues the file for the background pool and returns None, ready(path) is
+    emitted once it can be drawn. The view only asks for rows on screen, so only those are loaded;
+    requests for rows scrolled away are dropped once more than MAX_QUEUED are waiting.
+    Pixmaps are kept per image hash, files with the same art share one, within budget bytes.
+    """
+    ready = Signal(str)
+    _loaded = Signal(str, str, object)
+
+    def __init__(self, store=None, budget=MEMORY_BUDGET, size=THUMBNAIL_SIZE, threads=2, parent=None):
+        super().__init__(parent)
+        if store is None:
+            try:
+                store = ThumbnailStore()
+            except (OSError, sqlite3.Error):
+                #no disk cache, thumbnails are still made but only kept in memory
+                store = None
+        self.store = store
+        self.budget = budget
+        self.size = size
+        self._pixmaps = OrderedDict()   #hash -> QPixmap, least recently used first
+        self._bytes = 0
+        self._hashes = {}   #path -> hash of its art ("" for none) for files loaded so far
+        self._queue = deque()
+        self._queued = set()
+        self._loading = set()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(threads)
+        self._loaded.connect(self._on_loaded)
+
+    def thumbnail(self, path):
+        digest = self._hashes.get(path)
+        if digest == "":
+            return None
+        if digest is not None:
+            with self._lock:
+                pixmap = self._pixmaps.get(digest)
+                if pixmap is not None:
+                    self._pixmaps.move_to_end(digest)
+                    return pixmap
+        #not loaded yet, or dropped from memory since
+        self._request(path)
+        return None
+
+    def _request(self, path):
+        with self._lock:
+            if path in self._loading:
+                return
+            if path in self._queued:
+                #asked again, so it is on screen again, move it to the front
+                self._queue.remove(path)
+            else:
+                self._queued.add(path)
+            self._queue.append(path)
+            if len(self._queue) > MAX_QUEUED:
+                self._queued.discard(self._queue.popleft())
+            start = self._running < self._pool.maxThreadCount()
+            if start:
+                self._running += 1
+        if start:
+            self._pool.start(_Loader(self))
+
+    def _next(self):
+        #next path for a loader thread, None (and the loader stops) when there is nothing left
+        with self._lock:
+            if not self._queue:
+                self._running -= 1
+                return None
+            path = self._queue.pop()
+            self._queued.discard(path)
+            self._loading.add(path)
+            return path
+
+    def _has(self, digest):
+        with self._lock:
+            return digest in self._pixmaps
+
+    def _on_loaded(self, path, digest, image):
+        #gui thread, QPixmap can only be made here
+        with self._lock:
+            self._loading.discard(path)
+        self._hashes[path] = digest
+        if not digest:
+            return
+        if image is not None:
+            pixmap = QPixmap.fromImage(image)
+            with self._lock:
+                if digest not in self._pixmaps:
+                    self._pixmaps[digest] = pixmap
+                    self._bytes += pixmap.width() * pixmap.height() * max(1, pixmap.depth()) // 8
+                while self._bytes > self.budget and len(self._pixmaps) > 1:
+                    _, dropped = self._pixmaps.popitem(last=False)
+                    self._bytes -= dropped.width() * dropped.height() * max(1, dropped.depth()) // 8
+        self.ready.emit(path)
+
+    def close(self):
+        #drop queued work and save the index, loaders already running finish their current file
+        with self._lock:
+            self._queue.clear()
+            self._queued.clear()
+        #they'd emit into a deleted object otherwise
+        self._pool.waitForDone(2000)
+        if self.store is not None:
+            self.store.flush()
@@ -0,0 +1,211 @@
+#optional per-stage timing, exported as chrome trace event json (chrome://tracing or ui.perfetto.dev)
+#MUSEAMP_TRACE=<file> turns spans on ("1" writes to the cache folder), otherwise span() does nothing
+#MUSEAMP_PROFILE=<folder> also writes a cProfile dump (.prof, read with pstats/snakeviz) for every run
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import subprocess
+import threading
+import time
+from .utils import get_cache_dir
+
+#spans kept per process, later ones are dropped so a long gui session can't grow without bound
+MAX_EVENTS = 1000000
+
+_lock = threading.Lock()
+_events = []
+_thread_names = {}
+_trace_path = None
+_profile_dir = None
+_profiles = None    #Profile objects of the run being profiled, None when not profiling
+_local = threading.local()
+_origin = time.perf_counter()
+
+def _default_path(value, name):
+    #"1" means a file/folder in the cache folder, anything else is used as the path
+    if value in ("1", "true", "yes"):
+        return os.path.join(get_cache_dir(), name)
+    return value
+
+def enable(path=None):
+    #record spans and write them to path (default: trace-<pid>.json in the cache folder)
+    global _trace_path
+    first = _trace_path is None
+    _trace_path = path or os.path.join(get_cache_dir(), f"trace-{os.getpid()}.json")
+    if first:
+        #spans recorded after the last run finished (gui updates) are written on exit
+        atexit.register(write)
+
+def enable_profile(directory=None):
+    #write a cProfile dump for every run to directory (default: profiles in the cache folder)
+    global _profile_dir
+    _profile_dir = directory or os.path.join(get_cache_dir(), "profiles")
+
+def enabled():
+    return _trace_path is not None
+
+class span:
+    """
+    Time a block as a complete ("X") trace event: with trace.span("ffmpeg", file=path): ...
+    cat groups events in the viewer, keyword arguments show up as the event's args.
+    When tracing is off entering and leaving the block is a couple of attribute checks.
+    """
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat="stage", **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        if _trace_path is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            end = time.perf_counter()
+            _add(self.name, self.cat, self.start, end, self.args)
+        return False
+
+def _add(name, cat, start, end, args):
+    tid = threading.get_ident()
+    event = {
+        "name": name, "cat": cat, "ph": "X", "pid": os.getpid(), "tid": tid,
+        "ts": (start - _origin) * 1e6, "dur": (end - start) * 1e6,
+    }
+    if args:
+        event["args"] = {k: v if isinstance(v, (int, float, bool)) else str(v) for k, v in args.items()}
+    with _lock:
+        if tid not in _thread_names:
+            _thread_names[tid] = threading.current_thread().name
+        if len(_events) < MAX_EVENTS:
+            _events.append(event)
+
+def write(path=None):
+    #write every span recorded so far as chrome trace event json, returns the path or None
+    path = path or _trace_path
+    if path is None:
+        return None
+    with _lock:
+        events = list(_events)
+        names = dict(_thread_names)
+    pid = os.getpid()
+    meta = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "museamp"}}]
+    meta += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}} for tid, name in names.items()]
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": meta + events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, path)
+    except OSError:
+        return None
+    return path
+
+def run_process(name, cmd, **kwargs):
+    #subprocess.run, with separate spans for starting the process and for waiting on it while tracing
+    if _trace_path is None:
+        return subprocess.run(cmd, **kwargs)
+    kwargs.pop("check", None)
+    if kwargs.pop("capture_output", False):
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    with span(f"{name} spawn", "process"):
+        proc = subprocess.Popen(cmd, **kwargs)
+    with span(name, "process", pid=proc.pid):
+        stdout, stderr = proc.communicate()
+    return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+
+def _enable_thread_profile(profiles):
+    #one Profile per thread and run; python 3.12+ allows a single active profiler that already
+    #sees every thread, so enabling another one fails and is skipped
+    #returns None when nothing was enabled, including when this thread is already being profiled
+    if getattr(_local, "active", False):
+        return None
+    profile = getattr(_local, "profile", None)
+    if profile is None or getattr(_local, "profiles", None) is not profiles:
+        profile = cProfile.Profile()
+        _local.profile = profile
+        _local.profiles = profiles
+        with _lock:
+            profiles.append(profile)
+    try:
+        profile.enable()
+    except (ValueError, RuntimeError):
+        return None
+    _local.active = True
+    return profile
+
+def _disable_thread_profile(profile):
+    profile.disable()
+    _local.active = False
+
+def profiled(func):
+    #wrap a pool task so its thread is profiled too while a run is being profiled
+    profiles = _profiles
+    if profiles is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _enable_thread_profile(profiles)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profile is not None:
+                _disable_thread_profile(profile)
+    return wrapper
+
+def _dump_profiles(profiles, name):
+    stats = None
+    for profile in profiles:
+        try:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        except TypeError:
+            #a profile that never ran anything has no stats
+            continue
+    if stats is None:
+        return
+    try:
+        os.makedirs(_profile_dir, exist_ok=True)
+        stats.dump_stats(os.path.join(_profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"))
+    except OSError:
+        pass
+
+def job(name):
+    #decorator for a whole run: one span around it, the trace file is rewritten when it finishes
+    #and with profiling on, every thread doing its work is profiled into one dump
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _profiles
+            profiles = None
+            profile = None
+            if _profile_dir is not None and _profiles is None:
+                profiles = _profiles = []
+                profile = _enable_thread_profile(profiles)
+            try:
+                with span(name, "run"):
+                    return func(*args, **kwargs)
+            finally:
+                if profiles is not None:
+                    if profile is not None:
+                        _disable_thread_profile(profile)
+                    _profiles = None
+                    _dump_profiles(profiles, name)
+                write()
+        return wrapper
+    return decorate
+
+if os.environ.get("MUSEAMP_TRACE"):
+    enable(_default_path(os.environ["MUSEAMP_TRACE"], f"trace-{os.getpid()}.json"))
+if os.environ.get("MUSEAMP_PROFILE"):
+    enable_profile(_default_path(os.environ["MUSEAMP_PROFILE"], "profiles"))
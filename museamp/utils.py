@@ -1,7 +1,36 @@
 #utility functions for museamp
 
+import math
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
+def get_cache_dir():
+    #return the per-user cache directory for museamp (xdg on linux/flatpak, localappdata on windows)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")
+    elif sys.platform == "darwin":
+        base = str(Path.home() / "Library" / "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return str(Path(base) / "museamp")
+
+def compute_track_gain(loudness, peak, target_lufs=-18.0, max_peak_db=0.0, clip_mode="p"):
+    #work out a track's replaygain the same way rsgain does, returns (gain_db, clipping_adjusted)
+    #loudness in lufs, peak as a linear sample/true peak value, max_peak_db is the limiter (<= 0)
+    #clip_mode: "n" never limit, "p" only limit positive gains, "a" always limit
+    gain = target_lufs - loudness
+    if clip_mode == "n" or peak is None or peak <= 0:
+        return gain, False
+    max_peak = 10 ** (max_peak_db / 20)
+    new_peak = peak * 10 ** (gain / 20)
+    if (clip_mode == "a" or gain > 0) and new_peak > max_peak:
+        gain -= 20 * math.log10(new_peak / max_peak)
+        return gain, True
+    return gain, False
+
 def get_supported_filetypes():
     #return supported audio file extensions
     return {".flac", ".mp3", ".m4a"}
@@ -25,35 +54,91 @@ def filter_supported_files(filepaths):
 
 def get_files_in_folder(folder):
     #recursively get all supported files in a folder
-    folder = Path(folder)
-    return [
-        str(p) for p in folder.rglob("*")
-        if p.is_file() and is_supported_filetype(p)
-    ]
+    return find_supported_files(folder, get_supported_filetypes())
+
+def _scan_dir(path, supported_filetypes, recursive):
+    #list one directory, returns (supported_files, subdirectories)
+    #scandir's d_type hints mean no stat call per entry, except for symlinks
+    files = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                #like rglob, don't descend into symlinked directories (avoids loops)
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in supported_filetypes and entry.is_file():
+                    files.append(entry.path)
+            except OSError:
+                continue
+    files.sort()
+    subdirs.sort()
+    return files, subdirs
+
+def iter_supported_files(folder, supported_filetypes, recursive=True, jobs=None, cancel=None, errors=None):
+    """
+    Walk folder with os.scandir and yield lists of supported files, one list per directory
+    as soon as that directory has been read. With recursive set, subdirectories are read
+    by up to jobs threads at once, which hides the per-directory latency of network mounts.
+    cancel can be a threading.Event, the walk stops soon after it is set. Directories that
+    can't be read are skipped, with a message appended to errors if a list is given.
+    """
+    #directory reads are i/o bound, so use more threads than cores (same default as ThreadPoolExecutor)
+    jobs = max(1, int(jobs or min(32, (os.cpu_count() or 1) + 4)))
+    supported_filetypes = {ext.lower() for ext in supported_filetypes}
+    waiting = deque([str(folder)])
+
+    def scan(path):
+        try:
+            return _scan_dir(path, supported_filetypes, recursive)
+        except OSError as e:
+            if errors is not None:
+                errors.append(f"Failed to read folder '{path}': {e}")
+            return [], []
+
+    if jobs == 1:
+        while waiting and not (cancel is not None and cancel.is_set()):
+            files, subdirs = scan(waiting.popleft())
+            waiting.extend(subdirs)
+            if files:
+                yield files
+        return
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        pending = set()
+        while True:
+            if cancel is not None and cancel.is_set():
+                return
+            while waiting and len(pending) < jobs * 2:
+                pending.add(pool.submit(scan, waiting.popleft()))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                waiting.extend(subdirs)
+                if files:
+                    yield files
+    finally:
+        #don't wait for queued directory reads when the walk is cancelled or abandoned
+        pool.shutdown(wait=False, cancel_futures=True)
 
 def find_supported_files(folder, supported_filetypes, recursive=True, already_listed=None):
     #find supported files in a folder, optionally recursively, skipping already_listed
-    from pathlib import Path
-    import os
-    files = []
     already_listed = already_listed or set()
-    if recursive:
-        for path in Path(folder).rglob("*"):
-            if path.is_file() and path.suffix.lower() in supported_filetypes and str(path) not in already_listed:
-                files.append(str(path))
-    else:
-        for filename in os.listdir(folder):
-            path = Path(folder) / filename
-            if path.is_file() and path.suffix.lower() in supported_filetypes and str(path) not in already_listed:
-                files.append(str(path))
-    return files
+    return [
+        path
+        for batch in iter_supported_files(folder, supported_filetypes, recursive)
+        for path in batch
+        if path not in already_listed
+    ]
 
-def extract_cover_art(filepath, resize_cover=True):
+def extract_cover_art(filepath):
     """
-    Extract cover art from an audio file (FLAC, MP3, M4A).
-    Returns a mutagen.flac.Picture object if found, else None.
+    Extract cover art from an audio file (FLAC, MP3, M4A), preferring the front cover.
+    Returns a mutagen.flac.Picture object with the full-size image if found, else None.
+    Thumbnails for the table are made from this by museamp.thumbnails.
     """
-    import base64
     from pathlib import Path
     ext = Path(filepath).suffix.lower()
     try:
@@ -61,27 +146,27 @@ def extract_cover_art(filepath, resize_cover=True):
             from mutagen.flac import FLAC
             audio = FLAC(filepath)
             if audio.pictures:
-                return audio.pictures[0]
+                return next((p for p in audio.pictures if p.type == 3), audio.pictures[0])
         elif ext == ".mp3":
-            from mutagen.id3 import ID3, APIC
-            audio = ID3(filepath)
-            for tag in audio.values():
-                if isinstance(tag, APIC):
-                    from mutagen.flac import Picture
-                    pic = Picture()
-                    pic.data = tag.data
-                    pic.type = 3  # front cover
-                    pic.mime = tag.mime
-                    pic.desc = tag.desc
-                    return pic
+            from mutagen.id3 import ID3
+            pictures = ID3(filepath, load_v1=False).getall("APIC")
+            if pictures:
+                tag = next((p for p in pictures if p.type == 3), pictures[0])
+                from mutagen.flac import Picture
+                pic = Picture()
+                pic.data = tag.data
+                pic.type = 3  # front cover
+                pic.mime = tag.mime
+                pic.desc = tag.desc
+                return pic
         elif ext == ".m4a":
-            from mutagen.mp4 import MP4, MP4Cover
+            from mutagen.mp4 import MP4
             audio = MP4(filepath)
-            covr = audio.tags.get('covr')
+            covr = audio.tags.get('covr') if audio.tags is not None else None
             if covr:
                 from mutagen.flac import Picture
                 pic = Picture()
-                pic.data = covr[0]
+                pic.data = bytes(covr[0])
                 pic.type = 3
                 pic.mime = "image/jpeg" if covr[0].startswith(b'\xff\xd8') else "image/png"
                 return pic
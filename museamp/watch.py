@@ -0,0 +1,198 @@
+#change tracking for watched library folders, kept free of qt so any event source can drive it
+import os
+import threading
+import time
+
+#seconds a file has to stay unchanged before it is handed off for tagging
+DEFAULT_SETTLE = 2.0
+
+def _list_dir(path, supported_filetypes, recursive):
+    #returns ({file: (size, mtime_ns)}, [subdirectories]) for one directory
+    files = {}
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in supported_filetypes and entry.is_file():
+                    st = entry.stat()
+                    files[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+    return files, subdirs
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+class FolderWatch:
+    """
+    Snapshot of the supported files under a set of root folders, used to turn "this
+    directory changed" events into the files that are actually new or modified.
+    Changed files wait in a pending set until they have stopped changing for settle
+    seconds (so half-copied files are not picked up), then pop_ready hands them out in
+    one batch. Handed out files are ignored until done() records their new state, so
+    writing tags to them doesn't make them look changed again. All methods are thread-safe.
+    """
+
+    def __init__(self, supported_filetypes, settle=DEFAULT_SETTLE):
+        self.supported_filetypes = {ext.lower() for ext in supported_filetypes}
+        self.settle = settle
+        self.files = {}         #file -> (size, mtime_ns) as last seen
+        self.dir_files = {}     #directory -> set of files in it
+        self.dir_subdirs = {}   #directory -> set of subdirectories
+        self.recursive = {}     #directory -> whether its subdirectories are watched
+        self.pending = {}       #file -> ((size, mtime_ns), time of last change)
+        self.in_flight = set()
+        self.lock = threading.Lock()
+
+    def add_root(self, root, recursive=True):
+        #record the current contents of root without treating them as changed
+        #returns the directories that need to be watched
+        with self.lock:
+            return self._add_tree(os.path.normpath(str(root)), recursive, None)
+
+    def _add_tree(self, root, recursive, now):
+        #walk a directory tree into the snapshot, with now set its files are also marked pending
+        added = []
+        waiting = [root]
+        while waiting:
+            path = waiting.pop()
+            if path in self.dir_files:
+                continue
+            try:
+                files, subdirs = _list_dir(path, self.supported_filetypes, recursive)
+            except OSError:
+                continue
+            self.dir_files[path] = set(files)
+            self.dir_subdirs[path] = set(subdirs)
+            self.recursive[path] = recursive
+            for file_path, sig in files.items():
+                self.files[file_path] = sig
+                if now is not None and file_path not in self.in_flight:
+                    self.pending[file_path] = (sig, now)
+            waiting.extend(subdirs)
+            added.append(path)
+        return added
+
+    def _drop_tree(self, path):
+        #forget a directory that was removed, returns the directories that stop being watched
+        removed = []
+        waiting = [path]
+        while waiting:
+            path = waiting.pop()
+            if path not in self.dir_files:
+                continue
+            for file_path in self.dir_files.pop(path):
+                self.files.pop(file_path, None)
+                self.pending.pop(file_path, None)
+            waiting.extend(self.dir_subdirs.pop(path, ()))
+            self.recursive.pop(path, None)
+            removed.append(path)
+        return removed
+
+    def directory_changed(self, path, now=None):
+        #rescan one watched directory after a change event
+        #returns (directories to start watching, directories to stop watching)
+        now = time.monotonic() if now is None else now
+        path = os.path.normpath(str(path))
+        with self.lock:
+            if path not in self.dir_files:
+                return [], []
+            try:
+                files, subdirs = _list_dir(path, self.supported_filetypes, self.recursive[path])
+            except OSError:
+                #the directory itself is gone
+                return [], self._drop_tree(path)
+            for file_path in self.dir_files[path] - set(files):
+                self.files.pop(file_path, None)
+                self.pending.pop(file_path, None)
+            for file_path, sig in files.items():
+                if self.files.get(file_path) != sig:
+                    self.files[file_path] = sig
+                    if file_path not in self.in_flight:
+                        self.pending[file_path] = (sig, now)
+            self.dir_files[path] = set(files)
+            old_subdirs = self.dir_subdirs[path]
+            new_subdirs = set(subdirs)
+            self.dir_subdirs[path] = new_subdirs
+            removed = []
+            for subdir in old_subdirs - new_subdirs:
+                removed.extend(self._drop_tree(subdir))
+            added = []
+            #everything inside a newly created folder (a dropped in release) is new
+            for subdir in sorted(new_subdirs - old_subdirs):
+                added.extend(self._add_tree(subdir, True, now))
+            return added, removed
+
+    def file_changed(self, path, now=None):
+        #re-stat one tracked file after a change event, catches files rewritten in place
+        #(which doesn't touch their directory), returns False if it is gone or not tracked
+        now = time.monotonic() if now is None else now
+        path = os.path.normpath(str(path))
+        with self.lock:
+            if path not in self.files:
+                return False
+            sig = _signature(path)
+            if sig is None:
+                #the directory event that follows drops it
+                return False
+            if sig != self.files[path]:
+                self.files[path] = sig
+                if path not in self.in_flight:
+                    self.pending[path] = (sig, now)
+            return True
+
+    def files_in(self, directories):
+        #the tracked files directly inside the given directories
+        with self.lock:
+            return [file_path for path in directories for file_path in self.dir_files.get(os.path.normpath(str(path)), ())]
+
+    def pop_ready(self, now=None):
+        #return the pending files that have settled, sorted, and mark them in flight
+        now = time.monotonic() if now is None else now
+        ready = []
+        with self.lock:
+            for file_path, (sig, changed) in list(self.pending.items()):
+                if now - changed < self.settle:
+                    continue
+                current = _signature(file_path)
+                if current is None:
+                    del self.pending[file_path]
+                elif current != sig:
+                    #still being written, wait for it to settle again
+                    self.files[file_path] = current
+                    self.pending[file_path] = (current, now)
+                else:
+                    del self.pending[file_path]
+                    self.in_flight.add(file_path)
+                    ready.append(file_path)
+        ready.sort()
+        return ready
+
+    def next_delay(self, now=None):
+        #seconds until the next pending file could settle, None if nothing is pending
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if not self.pending:
+                return None
+            oldest = min(changed for _, changed in self.pending.values())
+        return max(0.0, oldest + self.settle - now)
+
+    def done(self, paths):
+        #record the state of files after they were tagged so the tag write isn't seen as a change
+        with self.lock:
+            for file_path in paths:
+                self.in_flight.discard(file_path)
+                sig = _signature(file_path)
+                if sig is not None and file_path in self.files:
+                    self.files[file_path] = sig
+                self.pending.pop(file_path, None)
+
+    def directories(self):
+        with self.lock:
+            return list(self.dir_files)
@@ -1,199 +1,192 @@
-import subprocess
-from pathlib import Path
-from PySide6.QtCore import QObject, Signal
-import os 
+#qt workers for the gui, the actual work lives in jobs.py so it can also run without qt
+import threading
+from PySide6.QtCore import QObject, Signal, Slot, QFileSystemWatcher, QTimer
+from .jobs import ResultBatcher, tag_files, scan_files, apply_gain
+from .utils import iter_supported_files
+from .watch import FolderWatch, DEFAULT_SETTLE
+
+class FolderScanWorker(QObject):
+    #background folder walk, streams the supported files it finds to the gui in batches
+    files = Signal(list)    #batches of discovered file paths
+    finished = Signal(list) #error_logs
+
+    def __init__(self, folders, supported_filetypes, recursive=True, jobs=None):
+        super().__init__()
+        self.folders = folders
+        self.supported_filetypes = supported_filetypes
+        self.recursive = recursive
+        self.jobs = jobs    #directories read at once, None = default for i/o bound work
+        self._cancel = threading.Event()
 
-#supported file types for processing
-supported_filetypes = {".flac", ".mp3", ".m4a"}
+    def cancel(self):
+        #called directly from the gui thread, the walk stops after the directories being read
+        self._cancel.set()
+
+    def run(self):
+        error_logs = []
+        batcher = ResultBatcher(self.files.emit)
+        for folder in self.folders:
+            for batch in iter_supported_files(folder, self.supported_filetypes, self.recursive,
+                                              jobs=self.jobs, cancel=self._cancel, errors=error_logs):
+                batcher.extend(batch)
+            if self._cancel.is_set():
+                break
+        batcher.flush()
+        self.finished.emit(error_logs)
+
+class FolderWatcher(QObject):
+    #watches library folders with QFileSystemWatcher (inotify on linux) and emits new or changed files
+    #once they have settled, so only those go through tagging instead of the whole library
+    #directories are watched for files being added, removed or replaced and the files themselves
+    #for being rewritten in place, which doesn't show up as a directory change
+    changed = Signal(list)  #batch of new or modified files, sorted
+    errors = Signal(list)   #error_logs for folders that couldn't be watched
+
+    def __init__(self, supported_filetypes, settle=DEFAULT_SETTLE):
+        super().__init__()
+        self.state = FolderWatch(supported_filetypes, settle)
+        self.watcher = None #created in start() so they belong to the watcher's thread
+        self.timer = None
+
+    @Slot()
+    def start(self):
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+        self.watcher.fileChanged.connect(self._on_file_changed)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._on_timer)
+
+    @Slot(str, bool)
+    def add_root(self, root, recursive=True):
+        #the initial walk runs here on the watcher thread, existing files are not reported
+        self._watch(self.state.add_root(root, recursive))
+
+    def done(self, paths):
+        #called directly from the gui thread once files are tagged, FolderWatch is thread-safe
+        self.state.done(paths)
+
+    def _watch(self, directories):
+        if not directories:
+            return
+        failed = self.watcher.addPaths(directories)
+        if failed:
+            #usually the inotify watch limit (fs.inotify.max_user_watches)
+            self.errors.emit([f"Failed to watch folder '{path}'" for path in failed])
+        self._watch_files(self.state.files_in(directories))
+
+    def _watch_files(self, files):
+        #files that can't be watched (watch limit) are still seen when added or replaced, just not when rewritten in place
+        if files:
+            self.watcher.addPaths(files)
+
+    def _on_directory_changed(self, path):
+        before = set(self.state.files_in([path]))
+        added, removed = self.state.directory_changed(path)
+        if removed:
+            watched = set(self.watcher.directories())
+            self.watcher.removePaths([p for p in removed if p in watched])
+        self._watch(added)
+        self._watch_files([p for p in self.state.files_in([path]) if p not in before])
+        self._schedule()
+
+    def _on_file_changed(self, path):
+        #qt drops the watch of a file that was replaced or removed, a replaced one is watched again
+        self.watcher.removePath(path)
+        if self.state.file_changed(path):
+            self.watcher.addPath(path)
+        self._schedule()
+
+    def _schedule(self):
+        #a burst of events keeps pushing files back, the timer fires once the oldest one settles
+        delay = self.state.next_delay()
+        if delay is not None:
+            self.timer.start(int(delay * 1000) + 50)
+
+    def _on_timer(self):
+        ready = self.state.pop_ready()
+        if ready:
+            self.changed.emit(ready)
+        self._schedule()
 
 class Worker(QObject):
     #background worker for analyzing/tagging files with replaygain
-    finished = Signal(list, list)   #updates, error_logs
+    results = Signal(list)  #batches of (row, loudness, replaygain, clipping) as files finish
+    finished = Signal(list) #error_logs
     progress = Signal(int)  #percent complete
 
-    def __init__(self, files, lufs=None, limiter=0.0, create_modified=False):
+    def __init__(self, files, lufs=None, limiter=0.0, create_modified=False, jobs=None, cache=None, batch_size=1,
+                 journal=None, per_device=True):
         super().__init__()
         self.files = files
         self.lufs = lufs
         self.limiter = limiter
         self.create_modified = create_modified
+        self.jobs = jobs    #max rsgain processes at once, None = one per cpu core
+        self.cache = cache  #optional AnalysisCache, unchanged files skip rsgain entirely
+        self.batch_size = batch_size    #files passed to each rsgain call
+        self.journal = journal  #optional JobJournal, records finished files so the run can be resumed
+        self.per_device = per_device    #separate adaptive limit for each disk/mount the files are on
         self.output_dir = None  #set by gui if needed
 
     def run(self):
-        updates = []
-        error_logs = []
-        total = len(self.files)
-        processed = 0
-
-        def emit_progress():
-            percent = int((processed / total) * 100) if total else 100
-            if percent > 100:
-                percent = 100
-            self.progress.emit(percent)
-
-        #handle output_dir for create_modified
-        output_dir = None
-        if self.create_modified:
-            if hasattr(self, "output_dir") and self.output_dir:
-                output_dir = Path(self.output_dir)
-                try:
-                    output_dir.mkdir(exist_ok=True)
-                except Exception as e:
-                    error_logs.append(f"Failed to create output directory '{output_dir}': {e}")
-                    self.finished.emit([], error_logs)
-                    return
-            else:
-                #fallback: use default location if not set
-                if self.files:
-                    first_file = Path(self.files[0])
-                    output_dir = first_file.parent / "museamp_modified"
-                    try:
-                        output_dir.mkdir(exist_ok=True)
-                    except Exception as e:
-                        error_logs.append(f"Failed to create output directory '{output_dir}': {e}")
-                        self.finished.emit([], error_logs)
-                        return
-
-        for row, file_path in enumerate(self.files):
-            ext = Path(file_path).suffix.lower()
-            if ext not in supported_filetypes:
-                updates.append((row, "-", "-", "-"))
-                processed += 1
-                emit_progress()
-                continue
-            out_file = file_path
-            if self.create_modified and output_dir:
-                p = Path(file_path)
-                #copy the file to the output_dir before tagging
-                out_file = str(output_dir / p.name)
-                if not Path(out_file).exists():
-                    try:
-                        #copy file before tagging
-                        with open(file_path, "rb") as src, open(out_file, "wb") as dst:
-                            dst.write(src.read())
-                    except Exception as e:
-                        error_logs.append(f"Failed to copy file '{file_path}' to '{out_file}': {e}")
-                        updates.append((row, "-", "-", "-"))
-                        processed += 1
-                        emit_progress()
-                        continue
-            lufs_str = f"-{abs(int(self.lufs))}" if self.lufs is not None else "-18"
-            limiter_str = f"-{abs(float(self.limiter))}"
-            loudness_val = "-"
-            replaygain_val = "-"
-            clipping_val = "-"
-            rsgain_cmd = [
-                "rsgain", "custom", "-s", "i", "-l", lufs_str, "-t", "-m", limiter_str, "-O", out_file
-            ]
-            if hasattr(self, "overwrite_rg") and not self.overwrite_rg:
-                rsgain_cmd.insert(2, "-S")
-            try:
-                proc = subprocess.run(
-                    rsgain_cmd,
-                    capture_output=True, text=True, check=False
-                )
-                output = proc.stdout
-                if proc.returncode == 0:
-                    lines = output.strip().splitlines()
-                    if len(lines) >= 2:
-                        header = lines[0].split('\t')
-                        values = lines[1].split('\t')
-                        colmap = {k: i for i, k in enumerate(header)}
-                        lufs = values[colmap.get("Loudness (LUFS)", -1)] if "Loudness (LUFS)" in colmap else "-"
-                        gain = values[colmap.get("Gain (dB)", -1)] if "Gain (dB)" in colmap else "-"
-                        if lufs != "-":
-                            loudness_val = f"{lufs} LUFS"
-                        if gain != "-":
-                            replaygain_val = gain
-                        clip_idx = colmap.get("Clipping", colmap.get("Clipping Adjustment?", -1))
-                        if clip_idx != -1:
-                            clip_val = values[clip_idx]
-                            if clip_val.strip().upper() in ("Y", "YES"):
-                                clipping_val = "Yes"
-                            elif clip_val.strip().upper() in ("N", "NO"):
-                                clipping_val = "No"
-                            else:
-                                clipping_val = clip_val
-                else:
-                    error_logs.append(f"{out_file}:\n{proc.stderr or proc.stdout}")
-            except Exception as e:
-                error_logs.append(f"{out_file}: {str(e)}")
-            updates.append((row, loudness_val, replaygain_val, clipping_val))
-            processed += 1
-            emit_progress()
-        self.finished.emit(updates, error_logs)
+        error_logs = tag_files(
+            self.files, self.lufs, self.limiter,
+            create_modified=self.create_modified,
+            output_dir=self.output_dir,
+            overwrite_rg=getattr(self, "overwrite_rg", True),
+            jobs=self.jobs,
+            cache=self.cache,
+            batch_size=self.batch_size,
+            journal=self.journal,
+            per_device=self.per_device,
+            on_results=self.results.emit,
+            on_progress=self.progress.emit
+        )
+        self.finished.emit(error_logs)
 
 class AddFilesWorker(QObject):
     #background worker for adding files/folders and analyzing them
-    finished = Signal(list, list)   #updates, error_logs
+    results = Signal(list)  #batches of (idx, loudness, replaygain, clipping) as files finish
+    finished = Signal(list) #error_logs
     progress = Signal(int)  #percent complete
 
-    def __init__(self, files):
+    def __init__(self, files, jobs=None, cache=None, batch_size=1, folders=None, backend="custom", read_tags=False,
+                 per_device=True):
         super().__init__()
         self.files = files
+        self.jobs = jobs    #max rsgain processes at once, None = one per cpu core
+        self.cache = cache  #optional AnalysisCache, unchanged files skip rsgain entirely
+        self.batch_size = batch_size    #files passed to each rsgain call
+        self.folders = folders or []    #folder trees the files came from
+        self.backend = backend  #"easy" scans self.folders with rsgain's own multithreaded scanner
+        self.read_tags = read_tags  #fill in files that have replaygain tags from them instead of decoding
+        self.per_device = per_device    #separate adaptive limit for each disk/mount the files are on
 
     def run(self):
-        updates = []
-        error_logs = []
-        total = len(self.files)
-        for idx, file_path in enumerate(self.files):
-            path = Path(file_path)
-            loudness_val = "-"
-            replaygain_val = "-"
-            clipping_val = "-"
-            if not path.is_file():
-                error_logs.append(f"{file_path}: Not a file")
-                updates.append((idx, loudness_val, replaygain_val, clipping_val))
-                self.progress.emit(int((idx + 1) / total * 100))
-                continue
-            if path.suffix.lower() not in supported_filetypes:
-                error_logs.append(f"{file_path}: Unsupported file type")
-                updates.append((idx, loudness_val, replaygain_val, clipping_val))
-                self.progress.emit(int((idx + 1) / total * 100))
-                continue
-            try:
-                cmd = [
-                    "rsgain", "custom",
-                    "-O",
-                    str(path)
-                ]
-                proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
-                output = proc.stdout
-                if proc.returncode == 0:
-                    lines = output.strip().splitlines()
-                    if len(lines) >= 2:
-                        header = lines[0].split('\t')
-                        values = lines[1].split('\t')
-                        colmap = {k: i for i, k in enumerate(header)}
-                        lufs = values[colmap.get("Loudness (LUFS)", -1)] if "Loudness (LUFS)" in colmap else "-"
-                        gain = values[colmap.get("Gain (dB)", -1)] if "Gain (dB)" in colmap else "-"
-                        if lufs != "-":
-                            loudness_val = f"{lufs} LUFS"
-                        if gain != "-":
-                            replaygain_val = gain
-                        clip_idx = colmap.get("Clipping", colmap.get("Clipping Adjustment?", -1))
-                        if clip_idx != -1:
-                            clip_val = values[clip_idx]
-                            if clip_val.strip().upper() in ("Y", "YES"):
-                                clipping_val = "Yes"
-                            elif clip_val.strip().upper() in ("N", "NO"):
-                                clipping_val = "No"
-                            else:
-                                clipping_val = clip_val
-                else:
-                    error_logs.append(f"{file_path}: rsgain failed\n{proc.stderr or proc.stdout}")
-            except Exception as e:
-                error_logs.append(f"{file_path}: {str(e)}")
-            updates.append((idx, loudness_val, replaygain_val, clipping_val))
-            self.progress.emit(int((idx + 1) / total * 100))
-        self.finished.emit(updates, error_logs)
+        error_logs = scan_files(
+            self.files,
+            jobs=self.jobs,
+            cache=self.cache,
+            batch_size=self.batch_size,
+            folders=self.folders,
+            backend=self.backend,
+            read_tags=self.read_tags,
+            per_device=self.per_device,
+            on_results=self.results.emit,
+            on_progress=self.progress.emit
+        )
+        self.finished.emit(error_logs)
 
 class ApplyGainWorker(QObject):
     #background worker for applying gain to files using ffmpeg
-    finished = Signal(list, list)  #error_logs, analysis_results
+    #each file is decoded once by rsgain for its measurement, the post-gain values are derived from it
+    results = Signal(list)  #batches of (row, loudness, replaygain, clipping) for finished output files
+    finished = Signal(list) #error_logs
     progress = Signal(int)   #percent
 
-    def __init__(self, files, lufs, limiter, table, supported_filetypes, create_modified=False):
+    def __init__(self, files, lufs, limiter, table, supported_filetypes, create_modified=False, jobs=None, batch_size=1,
+                 analysis_jobs=None, lossless_mp3=True, cache=None, journal=None, per_device=True):
         super().__init__()
         self.files = files
         self.lufs = lufs
@@ -201,183 +194,28 @@ class ApplyGainWorker(QObject):
         self.table = table
         self.supported_filetypes = supported_filetypes
         self.create_modified = create_modified
+        self.jobs = jobs    #max ffmpeg processes at once, None = one per cpu core
+        self.analysis_jobs = analysis_jobs  #max rsgain processes at once, None = half of jobs
+        self.batch_size = batch_size    #files passed to each rsgain call
+        self.lossless_mp3 = lossless_mp3    #patch mp3 frame gains in place instead of re-encoding
+        self.cache = cache  #optional AnalysisCache, files with a known loudness and true peak aren't measured again
+        self.journal = journal  #optional JobJournal, files it lists as done are not changed again
+        self.per_device = per_device    #separate adaptive limit for each disk/mount the files are on
         self.output_dir = None  # Will be set by GUI if needed
 
     def run(self):
-        error_logs = []
-        total = len(self.files)
-        # Use output_dir from GUI if provided
-        output_dir = None
-        if self.create_modified and self.files:
-            if hasattr(self, "output_dir") and self.output_dir:
-                output_dir = Path(self.output_dir)
-                try:
-                    output_dir.mkdir(exist_ok=True)
-                except Exception as e:
-                    error_logs.append(f"Failed to create output directory '{output_dir}': {e}")
-                    self.finished.emit(error_logs, [])
-                    return
-            else:
-                # fallback: use default location if not set
-                first_file = Path(self.files[0])
-                output_dir = first_file.parent / "museamp_modified"
-                try:
-                    output_dir.mkdir(exist_ok=True)
-                except Exception as e:
-                    error_logs.append(f"Failed to create output directory '{output_dir}': {e}")
-                    self.finished.emit(error_logs, [])
-                    return
-
-        for idx, file_path in enumerate(self.files):
-            ext = Path(file_path).suffix.lower()
-            if ext not in self.supported_filetypes:
-                continue
-            lufs_str = f"-{abs(self.lufs)}"
-            limiter_str = f"-{abs(float(self.limiter))}"
-            tag_cmd = [
-                "rsgain", "custom", "-s", "i", "-l", lufs_str, "-t", "-m", limiter_str, "-O", file_path
-            ]
-            gain_val = None
-            try:
-                proc_tag = subprocess.run(tag_cmd, capture_output=True, text=True, check=False)
-                if proc_tag.returncode != 0:
-                    error_logs.append(f"{file_path} (tag):\n{proc_tag.stderr or proc_tag.stdout}")
-                    self.progress.emit(int((idx + 1) / total * 100))
-                    continue
-                output = proc_tag.stdout
-                lines = output.strip().splitlines()
-                if len(lines) >= 2:
-                    header = lines[0].split('\t')
-                    values = lines[1].split('\t')
-                    colmap = {k: i for i, k in enumerate(header)}
-                    gain_idx = colmap.get("Gain (dB)", -1)
-                    if gain_idx != -1 and gain_idx < len(values):
-                        gain_val = values[gain_idx]
-                    else:
-                        gain_val = None
-            except Exception as e:
-                error_logs.append(f"{file_path} (tag): {str(e)}")
-                self.progress.emit(int((idx + 1) / total * 100))
-                continue
-
-            if gain_val is None or gain_val == "-":
-                error_logs.append(f"{file_path}: Could not determine ReplayGain value.")
-                self.progress.emit(int((idx + 1) / total * 100))
-                continue
-
-            try:
-                gain_db = float(gain_val)
-            except Exception:
-                error_logs.append(f"{file_path}: Invalid gain value '{gain_val}'.")
-                self.progress.emit(int((idx + 1) / total * 100))
-                continue
-
-            # Determine output file path
-            out_file = file_path
-            if self.create_modified and output_dir:
-                p = Path(file_path)
-                out_file = str(output_dir / p.name)
-
-            tmp_file = str(Path(out_file).with_suffix(f".gain_tmp{ext}"))
-            ffmpeg_cmd = [
-                "ffmpeg", "-y", "-i", file_path,
-                "-map_metadata", "0", "-map", "0",
-                "-af", f"volume={gain_db}dB",
-                "-c:v", "copy"
-            ]
-            if ext == ".mp3":
-                ffmpeg_cmd += ["-c:a", "libmp3lame"]
-            elif ext == ".flac":
-                ffmpeg_cmd += ["-c:a", "flac"]
-                try:
-                    probe = subprocess.run(
-                        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=bits_per_raw_sample,bits_per_sample", "-of", "default=noprint_wrappers=1:nokey=1", file_path],
-                        capture_output=True, text=True, check=False
-                    )
-                    bit_depths = [int(x) for x in probe.stdout.strip().splitlines() if x.isdigit()]
-                    if bit_depths:
-                        bit_depth = max(bit_depths)
-                        if bit_depth == 16:
-                            ffmpeg_cmd += ["-sample_fmt", "s16"]
-                        elif bit_depth == 24:
-                            ffmpeg_cmd += ["-sample_fmt", "s32"]
-                        elif bit_depth == 32:
-                            ffmpeg_cmd += ["-sample_fmt", "s32"]
-                except Exception:
-                    pass
-            elif ext == ".m4a":
-                # Default to AAC, but you could check for ALAC if needed
-                ffmpeg_cmd += ["-c:a", "aac"]
-            ffmpeg_cmd.append(tmp_file)
-            try:
-                #uses text=False to avoid decode errors, decode manually
-                proc_ffmpeg = subprocess.run(ffmpeg_cmd, capture_output=True, text=False, check=False)
-                #decode output safely for error reporting with latin1 fallback
-                def safe_decode(b):
-                    try:
-                        return b.decode('utf-8', errors='replace')
-                    except Exception:
-                        return b.decode('latin1', errors='replace')
-                if proc_ffmpeg.returncode != 0:
-                    stderr = safe_decode(proc_ffmpeg.stderr) if proc_ffmpeg.stderr else ""
-                    stdout = safe_decode(proc_ffmpeg.stdout) if proc_ffmpeg.stdout else ""
-                    error_logs.append(f"{file_path} (ffmpeg):\n{stderr or stdout}")
-                    if os.path.exists(tmp_file):
-                        os.remove(tmp_file)
-                    self.progress.emit(int((idx + 1) / total * 100))
-                    continue
-                os.replace(tmp_file, out_file)
-            except Exception as e:
-                error_logs.append(f"{file_path} (ffmpeg): {str(e)}")
-                if os.path.exists(tmp_file):
-                    os.remove(tmp_file)
-            self.progress.emit(int((idx + 1) / total * 100))
-
-        analysis_results = []
-        for idx, file_path in enumerate(self.files):
-            loudness_val = "-"
-            replaygain_val = "-"
-            clipping_val = "-"
-            ext = Path(file_path).suffix.lower()
-            # For modified output, analyze the output file, not the original
-            analyze_path = file_path
-            if self.create_modified and output_dir:
-                p = Path(file_path)
-                analyze_path = str(output_dir / p.name)
-            if ext not in self.supported_filetypes:
-                analysis_results.append((idx, loudness_val, replaygain_val, clipping_val))
-                continue
-            try:
-                limiter_str = f"-{abs(float(self.limiter))}"
-                proc = subprocess.run(
-                    ["rsgain", "custom", "-s", "i", "-l", lufs_str, "-t", "-m", limiter_str, "-O", analyze_path],
-                    capture_output=True, text=True, check=False
-                )
-                output = proc.stdout
-                if proc.returncode == 0:
-                    lines = output.strip().splitlines()
-                    if len(lines) >= 2:
-                        header = lines[0].split('\t')
-                        values = lines[1].split('\t')
-                        colmap = {k: i for i, k in enumerate(header)}
-                        lufs = values[colmap.get("Loudness (LUFS)", -1)] if "Loudness (LUFS)" in colmap else "-"
-                        gain = values[colmap.get("Gain (dB)", -1)] if "Gain (dB)" in colmap else "-"
-                        if lufs != "-":
-                            loudness_val = f"{lufs} LUFS"
-                        if gain != "-":
-                            replaygain_val = gain
-                        clip_idx = colmap.get("Clipping", colmap.get("Clipping Adjustment?", -1))
-                        if clip_idx != -1:
-                            clip_val = values[clip_idx]
-                            if clip_val.strip().upper() in ("Y", "YES"):
-                                clipping_val = "Yes"
-                            elif clip_val.strip().upper() in ("N", "NO"):
-                                clipping_val = "No"
-                            else:
-                                clipping_val = clip_val
-                else:
-                    error_logs.append(f"{analyze_path} (analyze):\n{proc.stderr or proc.stdout}")
-            except Exception as e:
-                error_logs.append(f"{analyze_path} (analyze): {str(e)}")
-            analysis_results.append((idx, loudness_val, replaygain_val, clipping_val))
-        self.finished.emit(error_logs, analysis_results)
+        error_logs = apply_gain(
+            self.files, self.lufs, self.limiter, self.supported_filetypes,
+            create_modified=self.create_modified,
+            output_dir=self.output_dir,
+            jobs=self.jobs,
+            batch_size=self.batch_size,
+            analysis_jobs=self.analysis_jobs,
+            lossless_mp3=self.lossless_mp3,
+            cache=self.cache,
+            journal=self.journal,
+            per_device=self.per_device,
+            on_results=self.results.emit,
+            on_progress=self.progress.emit
+        )
+        self.finished.emit(error_logs)
@@ -9,10 +9,18 @@ setup(
     include_package_data=True,
     install_requires=[
         "PySide6",
+        "mutagen",
     ],
+    extras_require={
+        #optional in-process loudness engine (--engine native)
+        "native": ["numpy", "scipy"],
+    },
     entry_points={
         "gui_scripts": [
             "MuseAmp = museamp.main:main",
         ],
+        "console_scripts": [
+            "museamp-cli = museamp.cli:main",
+        ],
     },
 )